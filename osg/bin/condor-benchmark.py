@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import datetime
+import contextlib
+import resource
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__))+'/..')
+
+import condor.data
+import condor.util
+import condor.plot
+import condor.probe
+import condor.command
+import condor.snapshot
+import condor.synthetic
+from condor.cli import cli
+
+parser = argparse.ArgumentParser(description='Time the stages of condor-probe on a synthetic pool, from condor.synthetic, served by fake condor_q/condor_history commands.')
+parser.add_argument('-jobs', default=100000, metavar='#', type=int, help='number of jobs (default=%(default)s)')
+parser.add_argument('-history', default=0.5, metavar='#', type=float, help='fraction of completed jobs (default=%(default)s)')
+parser.add_argument('-dir', default=None, metavar='PATH', type=str, help='directory for the synthetic pool, reused if it exists (default=temporary)')
+parser.add_argument('-seed', default=1, metavar='#', type=int, help='random seed for the synthetic pool (default=%(default)s)')
+parser.add_argument('-nologs', default=False, action='store_true', help='do not write job logs, skipping the -perf stages')
+parser.add_argument('-output', default=None, metavar='FILEPATH', type=str, help='append the results as JSON records, one per line')
+parser.add_argument('-baseline', default=None, metavar='FILEPATH', type=str, help='compare against the latest results for the same number of jobs in a previous -output')
+parser.add_argument('-tolerance', default=1.5, metavar='#', type=float, help='slowdown relative to -baseline considered a regression (default=%(default)s)')
+args = parser.parse_args(sys.argv[1:])
+
+# typical selections, e.g. from cron and the daily digest:
+selections = {
+  'all':[],
+  'user':['-user','alice'],
+  'site':['-site','MIT'],
+  'held':['-held'],
+  'running':['-running'],
+  'completed':['-completed'],
+  'cluster':['-condor','4000001'],
+  'generator':['-generator','lund'],
+  'host':['-host','node1'],
+  'veto':['-user=-alice','-site=-MIT'],
+}
+
+results = []
+
+def probe_args(opts=[]):
+  x = cli.parse_args(['-hours','24','-archive','','-logcache','','-clustercache','','-socket','']+opts)
+  with contextlib.redirect_stdout(io.StringIO()):
+    condor.probe.check(x)
+  return x
+
+def measure(stage, func, count=len):
+  '''Time one call of func, and record the number of items in its result'''
+  t0, c0 = time.perf_counter(), time.process_time()
+  ret = func()
+  t1, c1 = time.perf_counter(), time.process_time()
+  x = {'stage':stage, 'wall':round(t1-t0,4), 'cpu':round(c1-c0,4),
+    'items':count(ret) if count is not None else None,
+    'maxrss':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+  results.append(x)
+  print('%-22s %9.3f %9.3f %10s'%(stage, x['wall'], x['cpu'], x['items'] if x['items'] is not None else '-'))
+  sys.stdout.flush()
+  return ret
+
+def render(opts):
+  out = io.StringIO()
+  with contextlib.redirect_stdout(out):
+    condor.probe.report(probe_args(opts))
+  return out.getvalue().splitlines()
+
+def load(path):
+  condor.data.reset()
+  condor.snapshot.load(condor.data.job_cache, path)
+  return condor.data.job_cache
+
+directory = args.dir or tempfile.mkdtemp(prefix='condor-benchmark.')
+os.environ['PATH'] = directory+'/bin:'+os.environ['PATH']
+
+print('%-22s %9s %9s %10s'%('stage','wall','cpu','items'))
+if not os.path.exists(directory+'/queue.json'):
+  measure('generate', lambda: condor.synthetic.generate(directory, args.jobs,
+    args.history, logs=not args.nologs, seed=args.seed), count=sum)
+
+measure('query', lambda: condor.command.query(probe_args()) or condor.data.job_cache)
+condor.data.reset()
+for f in ('queue','history'):
+  classads = measure('parse:'+f, lambda: list(condor.util.read_json(open('%s/%s.json'%(directory,f)))))
+  measure('ingest:'+f, lambda: condor.data.add_classads(classads, probe_args(), condor.command.history_rank if f == 'history' else condor.command.queue_rank) or classads)
+del classads
+def munge():
+  x = probe_args()
+  condor.data.clusters.clear()
+  for job in condor.data.job_cache.values():
+    condor.data.munge_job(job, x)
+  return condor.data.job_cache
+measure('munge', munge)
+
+for name,opts in selections.items():
+  measure('select:'+name, lambda: list(condor.data.get_jobs(probe_args(opts))))
+measure('aggregate', lambda: condor.data.aggregate(probe_args()), count=lambda x: len(x['clusters']))
+measure('summary:clusters', lambda: condor.data.cluster_summary(probe_args()))
+measure('summary:sites', lambda: condor.data.site_summary(probe_args()))
+measure('summary:exits', lambda: condor.data.exit_code_summary(probe_args()).splitlines())
+measure('summary:efficiency', lambda: condor.data.retally(probe_args()) or condor.data.efficiency_summary().splitlines())
+measure('render:jobs', lambda: render([]))
+measure('render:summary', lambda: render(['-summary']))
+measure('render:sitesummary', lambda: render(['-sitesummary']))
+def fill():
+  x = probe_args()
+  x.plot = directory+'/benchmark.png'
+  return condor.plot.fill(x)
+measure('plot:fill', fill)
+
+snapshot = directory+'/benchmark.snapshot'
+measure('snapshot:save', lambda: condor.snapshot.save(condor.data.job_cache, snapshot) or condor.data.job_cache)
+measure('snapshot:load', lambda: load(snapshot))
+
+if not args.nologs:
+  cache = directory+'/benchmark.logcache'
+  if os.path.exists(cache):
+    os.remove(cache)
+  x = probe_args(['-perf','-logcache',cache])
+  measure('perf:cold', lambda: condor.data.analyze_logs(x) or list(condor.data.get_jobs(x)))
+  measure('perf:warm', lambda: condor.data.analyze_logs(x) or list(condor.data.get_jobs(x)))
+
+now = datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+for x in results:
+  x.update({'time':now, 'jobs':args.jobs, 'history':args.history})
+
+regressions = []
+if args.baseline:
+  baseline = {}
+  with open(args.baseline,'r') as f:
+    for line in f:
+      x = json.loads(line)
+      if x['jobs'] == args.jobs:
+        baseline[x['stage']] = x
+  print('\n%-22s %9s %9s %7s'%('stage','baseline','wall','ratio'))
+  for x in results:
+    if x['stage'] in baseline and x['stage'] != 'generate':
+      b = baseline[x['stage']]['wall']
+      ratio = x['wall']/b if b > 0 else 1
+      # ignore noise in stages that take just a few milliseconds:
+      regression = ratio > args.tolerance and x['wall']-b > 0.05
+      if regression:
+        regressions.append(x['stage'])
+      print('%-22s %9.3f %9.3f %7.2f%s'%(x['stage'], b, x['wall'], ratio, '  REGRESSION' if regression else ''))
+
+if args.output:
+  with open(args.output,'a') as f:
+    for x in results:
+      f.write(json.dumps(x, sort_keys=True)+'\n')
+
+if len(regressions) > 0:
+  print('\nRegressions:  '+' '.join(regressions))
+  sys.exit(1)
@@ -0,0 +1,109 @@
+###
+### Local SQLite archive of condor_history, updated incrementally from
+### the schedd by tracking the newest CompletionDate already ingested
+###
+
+import os
+import json
+import time
+import sqlite3
+
+default_path = os.getenv('HOME','.')+'/.condor-history.db'
+
+# completed jobs older than this are pruned from the archive:
+retention_days = 35
+
+# incremental updates refetch this many seconds before the newest
+# CompletionDate archived, since condor_history stops at the first job
+# completed before -since, and jobs do not enter the history file in
+# strict order of completion, e.g. after lingering in the queue:
+overlap = 6*60*60
+
+class HistoryArchive():
+  '''Completed jobs, stored as JSON ClassAds restricted to a set of
+  attributes, covering CompletionDates from a low-water mark onwards'''
+  def __init__(self, path, attributes):
+    self.attributes = sorted(set(attributes))
+    self.db = sqlite3.connect(path, timeout=300)
+    self.db.execute('CREATE TABLE IF NOT EXISTS jobs (condorid TEXT PRIMARY KEY,'
+      ' cluster INTEGER, completion INTEGER, classad TEXT)')
+    self.db.execute('CREATE INDEX IF NOT EXISTS jobs_completion ON jobs (completion)')
+    self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    self.db.commit()
+    # discard everything if the stored attributes are insufficient:
+    if self.get('attributes') != ','.join(self.attributes):
+      self.clear()
+  def get(self, key):
+    row = self.db.execute('SELECT value FROM meta WHERE key=?', (key,)).fetchone()
+    return None if row is None else row[0]
+  def set(self, key, value):
+    self.db.execute('INSERT OR REPLACE INTO meta VALUES (?,?)', (key,str(value)))
+  def clear(self):
+    self.db.execute('DELETE FROM jobs')
+    self.db.execute('DELETE FROM meta')
+    self.set('attributes', ','.join(self.attributes))
+    self.db.commit()
+  def low_water(self):
+    x = self.get('low')
+    return None if x is None else int(x)
+  def high_water(self):
+    x = self.get('high')
+    return None if x is None else int(x)
+  def insert(self, classads):
+    '''Store completed jobs, returning the newest CompletionDate.  Jobs
+    removed before completing, which have none, are stored by the time
+    they were removed, EnteredCurrentStatus, if fetched.'''
+    newest = None
+    rows = []
+    for x in classads:
+      if 'ClusterId' not in x or 'ProcId' not in x:
+        continue
+      if x.get('CompletionDate'):
+        completion = int(x['CompletionDate'])
+        if newest is None or completion > newest:
+          newest = completion
+      elif x.get('EnteredCurrentStatus'):
+        completion = int(x['EnteredCurrentStatus'])
+      else:
+        continue
+      x = {k:x[k] for k in self.attributes if k in x}
+      rows.append(('%d.%d'%(x['ClusterId'],x['ProcId']), x['ClusterId'], completion, json.dumps(x)))
+      if len(rows) >= 1000:
+        self.db.executemany('INSERT OR REPLACE INTO jobs VALUES (?,?,?,?)', rows)
+        rows = []
+    self.db.executemany('INSERT OR REPLACE INTO jobs VALUES (?,?,?,?)', rows)
+    return newest
+  def sync(self, fetch, start, refresh=False):
+    '''Ensure the archive covers CompletionDates from start until now, where
+    fetch(since) must return the ClassAds completed at or after since'''
+    if refresh:
+      self.clear()
+    cutoff = int(time.time()) - retention_days*24*60*60
+    self.db.execute('DELETE FROM jobs WHERE completion<?', (cutoff,))
+    low, high = self.low_water(), self.high_water()
+    if low is not None:
+      low = max(low, cutoff)
+    if low is None or high is None or start < low:
+      since, low = start, start
+    else:
+      since = high - overlap
+    newest = self.insert(fetch(since))
+    if high is None or (newest is not None and newest > high):
+      high = newest if newest is not None else since
+    self.set('low', low)
+    self.set('high', high)
+    self.db.commit()
+  def select(self, start, end, clusters=[]):
+    '''Yield the ClassAds completed between start and end, optionally
+    restricted to some cluster ids'''
+    sql = 'SELECT classad FROM jobs WHERE completion>=? AND completion<=?'
+    values = [start, end]
+    if len(clusters) > 0:
+      sql += ' AND cluster IN (%s)' % ','.join(['?']*len(clusters))
+      values.extend([int(x) for x in clusters])
+    # newest first, like condor_history, which for equal times is the
+    # order they were fetched in:
+    for row in self.db.execute(sql+' ORDER BY completion DESC, rowid ASC', values):
+      yield json.loads(row[0])
+  def close(self):
+    self.db.close()
@@ -4,13 +4,19 @@
 ###
 
 import argparse
+import condor.pool
 import condor.data
+import condor.archive
+import condor.logcache
+import condor.clustercache
+import condor.server
 
 cli = argparse.ArgumentParser(description='Wrap condor_q and condor_history and add features for CLAS12.',
     epilog='''(1) Repeatable "limit" options are first OR\'d independently, then AND'd together, and if their
     argument is prefixed with a dash ("-"), it is a veto (overriding the \'OR\').  (2) For non-numeric arguments
     starting with a dash, use the "-opt=arg" format.  (3) Per-site wall-hour tallies ignore running jobs, unless
-    -running is specified.  (4) Efficiencies and process wall hours are only calculated for completed jobs.  (5) Known exit codes are: '''
+    -running is specified.  (4) Efficiencies and process wall hours are only calculated for completed jobs.  (5) The Efficiency Summary
+    tallies only the jobs matching the limit options, e.g. just the bad attempts of held jobs for -held.  (6) Known exit codes are: '''
     +', '.join(['%d=%s'%(k,v) for k,v in condor.data.exit_codes.items()]))
 cli.add_argument('-condor', default=[], metavar='#', action='append', type=int, help='limit by condor cluster id (repeatable)')
 cli.add_argument('-gemc', default=[], metavar='#', action='append', type=int, help='limit by gemc submission id (repeatable)')
@@ -27,15 +33,28 @@ cli.add_argument('-completed', default=False, action='store_true', help='limit t
 cli.add_argument('-summary', default=False, action='store_true', help='tabulate by cluster id instead of per-job')
 cli.add_argument('-sitesummary', default=False, action='store_true', help='tabulate by site instead of per-job')
 cli.add_argument('-hours', default=0, metavar='#', type=float, help='look back # hours for completed jobs, reative to -end (default=0)')
+cli.add_argument('-archive', default=condor.archive.default_path, metavar='FILEPATH', type=str, help='local condor_history archive, updated incrementally, through which all -hours queries go unless -json (default=%(default)s, empty=disable)')
+cli.add_argument('-refresh', default=False, action='store_true', help='discard the local condor_history archive and fully reload it')
 cli.add_argument('-end', default=None, metavar='YYYY/MM/DD[_HH:MM:SS]', type=str, help='end date for look back for completed jobs (default=now)')
+cli.add_argument('-limit', default=None, metavar='#', type=int, help='print at most # table rows')
+cli.add_argument('-page', default=None, metavar='#', type=int, help='repeat the table header every # rows, pausing if interactive')
 cli.add_argument('-tail', default=None, metavar='#', type=int, help='print last # lines of logs (negative=all, 0=filenames)')
 cli.add_argument('-cvmfs', default=False, action='store_true', help='print hostnames from logs with CVMFS errors')
 cli.add_argument('-xrootd', default=False, action='store_true', help='print hostnames from logs with XRootD errors')
 cli.add_argument('-vacate', default=-1, metavar='#', type=float, help='vacate jobs with wall hours greater than #')
 cli.add_argument('-hold', default=False, action='store_true', help='send matching jobs to hold state (be careful!!!)')
 cli.add_argument('-json', default=False, action='store_true', help='print full condor data in JSON format')
-cli.add_argument('-input', default=False, metavar='FILEPATH', type=str, help='read condor data from a JSON file instead of querying')
+cli.add_argument('-input', default=False, metavar='FILEPATH', type=str, help='read condor data from a JSON file or a -save snapshot instead of querying')
+cli.add_argument('-diff', default=None, metavar='FILEPATH', type=str, help='print job state transitions since a -save snapshot, overall, per site and new clusters')
+cli.add_argument('-save', default=None, metavar='FILEPATH', type=str, help='save the job data to a binary snapshot, for fast reloading with -input')
 cli.add_argument('-timeline', default=False, action='store_true', help='publish results for timeline generation')
 cli.add_argument('-perf', default=False, action='store_true', help='get more performance info (from logs, slow), e.g. sub-wall times, exit codes')
-cli.add_argument('-plot', default=False, metavar='FILEPATH', const=True, nargs='?', help='generate plots (requires ROOT)')
+cli.add_argument('-logcache', default=condor.logcache.default_path, metavar='FILEPATH', type=str, help='cache of results parsed from log files (default=%(default)s, empty=disable)')
+cli.add_argument('-clustercache', default=condor.clustercache.default_path, metavar='FILEPATH', type=str, help='cache of generators and versions parsed from job scripts (default=%(default)s, empty=disable)')
+cli.add_argument('-threads', default=condor.pool.default_threads, metavar='#', type=int, help='number of threads for reading log files (default=%(default)s)')
+cli.add_argument('-profile', default=False, metavar='FILEPATH', const=True, nargs='?', help='print the time, memory and number of items of each stage to stderr, and append them as JSON to FILEPATH if given')
+cli.add_argument('-plot', default=False, metavar='FILEPATH', const=True, nargs='?', help='generate plots (requires ROOT), saved to FILEPATH if given (comma-separated for multiple formats)')
 
+cli.add_argument('-serve', default=False, action='store_true', help='keep all jobs in memory, refreshed every -interval seconds, to answer queries from other invocations via -socket')
+cli.add_argument('-interval', default=condor.server.default_interval, metavar='#', type=float, help='seconds between refreshes for -serve (default=%(default)s)')
+cli.add_argument('-socket', default=condor.server.default_path, metavar='FILEPATH', type=str, help='socket of a -serve process, queried instead of condor if running (default=%(default)s, empty=disable)')
@@ -0,0 +1,71 @@
+###
+### Persistent SQLite cache of metadata parsed from each cluster's job
+### script, keyed by ClusterId and the script's modification time, since
+### scripts never change after submission
+###
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import condor.archive
+
+default_path = os.getenv('HOME','.')+'/.condor-clusters.db'
+
+# entries for clusters not looked up for this long, i.e. no longer in the
+# queue or the history archive, are evicted:
+max_age_days = condor.archive.retention_days
+
+class ClusterCache():
+  '''Metadata for each cluster, with hit/miss/eviction counts for this
+  process in counts.  Lookups may come from any thread.'''
+  def __init__(self, path):
+    self.db = sqlite3.connect(path, timeout=300, check_same_thread=False)
+    self.db.execute('CREATE TABLE IF NOT EXISTS clusters (cluster INTEGER PRIMARY KEY,'
+      ' mtime REAL, seen INTEGER, metadata TEXT)')
+    self.db.commit()
+    self.counts = {'hits':0, 'misses':0, 'evictions':0}
+    self.updates = {}
+    self.used = set()
+    self.missing = set()
+    self.lock = threading.Lock()
+  def get(self, cluster, script, func):
+    '''Get the metadata of a cluster, else func(script) if the script
+    changed or was never parsed'''
+    try:
+      mtime = os.stat(script).st_mtime
+    except (OSError, TypeError):
+      with self.lock:
+        self.missing.add(cluster)
+      return func(script)
+    with self.lock:
+      row = self.db.execute('SELECT mtime,metadata FROM clusters WHERE cluster=?', (cluster,)).fetchone()
+      if row is not None and row[0] == mtime:
+        self.counts['hits'] += 1
+        self.used.add(cluster)
+        return json.loads(row[1])
+      self.counts['misses'] += 1
+    value = func(script)
+    with self.lock:
+      self.updates[cluster] = (mtime, value)
+    return value
+  def save(self):
+    '''Write new entries, refresh the ones used, and evict stale ones and
+    those whose scripts no longer exist'''
+    now = int(time.time())
+    with self.lock:
+      self.db.executemany('UPDATE clusters SET seen=? WHERE cluster=?', [(now,x) for x in self.used])
+      self.db.executemany('INSERT OR REPLACE INTO clusters VALUES (?,?,?,?)',
+        [(k,v[0],now,json.dumps(v[1])) for k,v in self.updates.items()])
+      x = self.db.executemany('DELETE FROM clusters WHERE cluster=?', [(x,) for x in self.missing])
+      self.counts['evictions'] += max(0, x.rowcount)
+      x = self.db.execute('DELETE FROM clusters WHERE seen<?', (now-max_age_days*24*60*60,))
+      self.counts['evictions'] += max(0, x.rowcount)
+      self.db.commit()
+      self.updates = {}
+      self.used = set()
+      self.missing = set()
+  def close(self):
+    self.db.close()
@@ -2,63 +2,147 @@
 ### Command wrappers for HTCondor that also update a temporary condor.data job cache
 ###
 
+import re
 import json
 import datetime
 import subprocess
+import concurrent.futures
 
 import condor.data
+import condor.pool
+import condor.plot
+import condor.table
+import condor.archive
+import condor.matching
 
-def queue(constraints=[], opts=[]):
+# jobs from condor_history supersede those from condor_q:
+queue_rank = 0
+history_rank = 1
+
+def get_attributes(args):
+  '''Get the ClassAd attributes needed by the tables, matchers, summaries
+  and plots selected by args, or None for all attributes (for -json)'''
+  if args.json:
+    return None
+  keys = set(condor.data.munge_attributes)
+  keys.update(condor.matching.CondorMatchers(args).keys())
+  keys.update([x.varname for x in condor.table.job_table.columns])
+  if args.summary or args.timeline:
+    keys.update([x.varname for x in condor.table.summary_table.columns])
+  if args.sitesummary or args.timeline:
+    keys.update([x.varname for x in condor.table.site_table.columns])
+  if args.plot is not False:
+    keys.update(condor.plot.keys)
+  return sorted(condor.data.get_attributes(keys))
+
+def json_opts(attributes):
+  '''Get the condor_q/condor_history options for JSON output'''
+  ret = ['-json']
+  if attributes is not None:
+    ret.extend(['-attributes',','.join(attributes)])
+  return ret
+
+def constraint_opts(args):
+  '''Get the options for the schedd to apply the matchers in args'''
+  x = condor.matching.CondorMatchers(args).constraint()
+  return [] if x is None else ['-constraint',x]
+
+def queue(args, constraints=[], opts=[]):
   '''Get the JSON from condor_q'''
   cmd = ['condor_q','gemc']
   cmd.extend(constraints)
   cmd.extend(opts)
-  cmd.extend(['-nobatch','-json'])
-  condor.data.add_json(cmd)
+  cmd.extend(constraint_opts(args))
+  cmd.append('-nobatch')
+  cmd.extend(json_opts(get_attributes(args)))
+  condor.data.add_json(cmd, args, queue_rank)
 
-def history(args, constraints=[]):
-  '''Get the JSON from condor_history'''
-  start = args.end + datetime.timedelta(hours = -args.hours)
-  start = str(int(start.timestamp()))
+def history_command(since, constraints=[], attributes=None, opts=[]):
+  '''Get the condor_history command for jobs completed since a timestamp'''
   cmd = ['condor_history','gemc']
   cmd.extend(constraints)
-  cmd.extend(['-json','-since',"CompletionDate!=0&&CompletionDate<%s"%start])
-  condor.data.add_json(cmd)
+  cmd.extend(opts)
+  cmd.extend(json_opts(attributes))
+  cmd.extend(['-since',"CompletionDate!=0&&CompletionDate<%d"%since])
+  return cmd
+
+def history(args, constraints=[]):
+  '''Get the JSON from condor_history, via the local archive unless
+  it is disabled or full ClassAds are requested'''
+  start = args.end + datetime.timedelta(hours = -args.hours)
+  start = int(start.timestamp())
+  if not args.archive or args.json:
+    cmd = history_command(start, constraints, get_attributes(args), constraint_opts(args))
+    condor.data.add_json(cmd, args, history_rank)
+  else:
+    # the archive must serve any later query, so it needs all attributes:
+    attributes = sorted(condor.data.get_attributes(condor.data.job_cache.columns))
+    archive = condor.archive.HistoryArchive(args.archive, attributes)
+    # plus the time of removal, for jobs removed before completing:
+    fetched = attributes+['EnteredCurrentStatus']
+    archive.sync(lambda since: condor.data.read_command(history_command(since, attributes=fetched)), start, args.refresh)
+    condor.data.add_classads(archive.select(start, int(args.end.timestamp()), constraints), args, history_rank)
+    archive.close()
 
 def query(args):
-  '''Load data from condor_q and condor_history'''
+  '''Load and munge data from condor_q and condor_history, concurrently'''
   constraints = []
   for x in args.condor:
     if not str(x).startswith('-'):
       constraints.append(str(x))
+  if args.json:
+    condor.data.job_cache.retain()
   opts = []
   if args.held:
     opts.append('-hold')
   if args.running:
     opts.append('-run')
-  if not args.completed or args.plot is not False:
-    queue(constraints=constraints, opts=opts)
-  if args.hours > 0:
-    history(args, constraints=constraints)
-  condor.data.munge(args)
+  condor.data.open_cluster_cache(args)
+  with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+    futures = []
+    if not args.completed or args.plot is not False:
+      futures.append(pool.submit(queue, args, constraints=constraints, opts=opts))
+    if args.hours > 0:
+      futures.append(pool.submit(history, args, constraints=constraints))
+    for f in futures:
+      f.result()
+  condor.data.close_cluster_cache()
+  condor.data.job_cache.sort()
+  condor.data.analyze_logs(args)
+
+# maximum number of jobs per condor_vacate_job/condor_hold command:
+batch_size = 100
 
-def vacate(job):
-  cmd = ['condor_vacate_job', '-fast', job.get('condorid')]
-  response = None
-  try:
-    response = subprocess.check_output(cmd).decode('UTF-8').rstrip()
-    if re.fullmatch('Job %s fast-vacated'%job.get('condorid'), response) is None:
-      raise ValueError()
-  except:
-    print('ERROR running command "%s":\n%s'%(' '.join(cmd),response))
-  print(str(job.get('MATCH_GLIDEIN_Site'))+' '+str(job.get('RemoteHost'))+' '+str(job.get('condorid')))
+def act(cmd, jobs, response, threads=condor.pool.default_threads):
+  '''Run a command on the condor ids of jobs, in batches of batch_size
+  ids with up to threads batches at a time, yielding each job in order
+  with whether the command's output had the line expected for it,
+  response % condorid, and the output lines about it'''
+  def run(batch):
+    x = subprocess.run(cmd+[job.get('condorid') for job in batch],
+      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return x.stdout.decode('UTF-8').splitlines()
+  batches = [jobs[i:i+batch_size] for i in range(0, len(jobs), batch_size)]
+  for batch,lines in condor.pool.imap(run, batches, threads):
+    for job in batch:
+      cid = job.get('condorid')
+      if lines is None:
+        yield (job, False, ['timed out or failed'])
+        continue
+      about = [x for x in lines if re.search('\\b%s\\b'%re.escape(cid), x) is not None]
+      yield (job, response%cid in [x.strip() for x in about], about if len(about)>0 else lines)
 
-def hold(job):
-  cmd = ['condor_hold', job.get('condorid')]
-  response = None
-  try:
-    response = subprocess.check_output(cmd).decode('UTF-8').rstrip()
-    print(response)
-  except:
-    print('ERROR running command "%s":\n%s'%(' '.join(cmd),response))
+def vacate(jobs, threads=condor.pool.default_threads):
+  cmd = ['condor_vacate_job', '-fast']
+  for job,ok,lines in act(cmd, jobs, 'Job %s fast-vacated', threads):
+    if not ok:
+      print('ERROR running command "%s":\n%s'%(' '.join(cmd+[job.get('condorid')]),'\n'.join(lines)))
+    print(str(job.get('MATCH_GLIDEIN_Site'))+' '+str(job.get('RemoteHost'))+' '+str(job.get('condorid')))
 
+def hold(jobs, threads=condor.pool.default_threads):
+  cmd = ['condor_hold']
+  for job,ok,lines in act(cmd, jobs, 'Job %s held', threads):
+    if ok:
+      print('Job %s held'%job.get('condorid'))
+    else:
+      print('ERROR running command "%s":\n%s'%(' '.join(cmd+[job.get('condorid')]),'\n'.join(lines)))
@@ -3,20 +3,29 @@
 ###
 
 import os
+import io
 import re
 import sys
-import stat
 import json
 import datetime
+import threading
 import subprocess
 import collections
 
+import condor.pool
+import condor.profile
+import condor.logcache
+import condor.clustercache
+import condor.store
+import condor.snapshot
 import condor.matching
 import condor.util
 import condor.table
+import condor.timeline
 
 json_format =  {'indent':2, 'separators':(',',': '), 'sort_keys':True}
-log_regex = '/([a-z]+)/job_([0-9]+)/log/job\.([0-9]+)\.([0-9]+)\.'
+log_template = '/%s/job_%s/log/job\.([0-9]+)\.([0-9]+)\.'
+log_regex = log_template % ('([a-z]+)','([0-9]+)')
 job_states = {0:'U', 1:'I', 2:'R', 3:'X', 4:'C', 5:'H', 6:'E'}
 job_counts = {'done':0, 'run':0, 'idle':0, 'held':0, 'other':0, 'total':0}
 exit_codes = { 202:'cvmfs', 203:'generator', 211:'ls', 204:'gemc', 0:'success/unknown',
@@ -25,112 +34,265 @@ cvmfs_error_strings = [ 'Loaded environment state is inconsistent',
   'Command not found','Unable to access the Singularity image','CVMFS ERROR']
 #  'No such file or directory', 'Transport endpoint is not connected',
 
-job_tallies = {'goodwall':0, 'badwall':0, 'goodcpu':0, 'badcpu':0, 'goodattempts':0, 'badattempts':0, 'attempts':[]}
-job_cache = collections.OrderedDict()
+job_tallies = {'goodwall':0, 'badwall':0, 'goodcpu':0, 'badcpu':0, 'goodattempts':0, 'badattempts':0, 'attempts':0, 'nattempts':0}
+
+tasks = ['gen','gemc','bg','dn','rec']
+labels = {'gen':'GENERATOR','gemc':'GEMC','bg':'BG-MERGING','dn':'DE-NOISING','rec':'RECONSTRUCTION'}
+
+def _condor(job):
+  if job.get('gemc') is not None:
+    return job.get('condorid')
+
+def _log(job, suffix):
+  if job.get('gemc') is not None:
+    return job['UserLog'][0:-4]+suffix
+
+def _gemcjob(job):
+  if job.get('Args') is not None:
+    return '.'.join(job.get('Args').split()[0:2])
+
+def new_job_table():
+  '''Get an empty job store, with the subset of ClassAd attributes
+  retained plus those derived in munge'''
+  return condor.store.JobTable([
+    condor.store.IntColumn('ClusterId'),
+    condor.store.IntColumn('ProcId'),
+    condor.store.IntColumn('JobStatus','b'),
+    condor.store.IntColumn('NumJobStarts'),
+    condor.store.IntColumn('TotalSubmitProcs'),
+    condor.store.IntColumn('ExitCode'),
+    condor.store.BoolColumn('ExitBySignal'),
+    condor.store.IntColumn('QDate','q'),
+    condor.store.IntColumn('JobCurrentStartDate','q'),
+    condor.store.IntColumn('CompletionDate','q'),
+    condor.store.IntColumn('DiskUsage','q'),
+    condor.store.FloatColumn('CumulativeSlotTime'),
+    condor.store.FloatColumn('RemoteUserCpu'),
+    condor.store.FloatColumn('CumulativeRemoteUserCpu'),
+    condor.store.CodeColumn('MATCH_GLIDEIN_Site'),
+    condor.store.CodeColumn('RemoteHost'),
+    condor.store.CodeColumn('LastRemoteHost'),
+    condor.store.Column('UserLog'),
+    condor.store.Column('Args'),
+    condor.store.CodeColumn('user'),
+    condor.store.CodeColumn('gemc'),
+    condor.store.CodeColumn('host'),
+    condor.store.CodeColumn('generator'),
+    condor.store.CodeColumn('versions'),
+    condor.store.FloatColumn('wallhr','%.2f'),
+    condor.store.FloatColumn('eff','%.2f'),
+    condor.store.NumberColumn('ceff','%.2f'),
+    condor.store.VectorColumn('benchmark', tasks),
+    condor.store.BoolColumn('cvmfs'),
+  ], derived = {
+    'condorid': lambda job: '%d.%d'%(job['ClusterId'],job['ProcId']),
+    'condor': _condor,
+    'stdout': lambda job: _log(job, '.out'),
+    'stderr': lambda job: _log(job, '.err'),
+    'gemcjob': _gemcjob,
+  }, indexes = ['ClusterId','JobStatus','ExitCode','MATCH_GLIDEIN_Site','user','gemc','generator'])
+
+job_cache = new_job_table()
+
+# ClassAd attributes needed to derive the custom job parameters:
+wallhr_attributes = ['JobStatus','JobCurrentStartDate','CompletionDate']
+derived_attributes = {
+  'condorid':['ClusterId','ProcId'],
+  'condor':['ClusterId','ProcId','UserLog'],
+  'stdout':['UserLog'],
+  'stderr':['UserLog'],
+  'gemcjob':['Args'],
+  'user':['UserLog'],
+  'gemc':['UserLog'],
+  'host':['RemoteHost'],
+  'generator':['ClusterId','UserLog'],
+  'versions':['ClusterId','UserLog'],
+  'wallhr':wallhr_attributes,
+  'eff':wallhr_attributes+['RemoteUserCpu'],
+  'ceff':['JobStatus','RemoteUserCpu','CumulativeSlotTime'],
+  'benchmark':['JobStatus','UserLog'],
+  'cvmfs':['UserLog'],
+  # ... and those only in summaries:
+  'total':[],
+  'done':['JobStatus','TotalSubmitProcs'],
+  'run':['JobStatus'],
+  'idle':['JobStatus'],
+  'held':['JobStatus'],
+  'att':['NumJobStarts'],
+  'ewallhr':wallhr_attributes,
+  'benchmarks':['JobStatus','UserLog'],
+}
+
+# ClassAd attributes always needed by munge and tally:
+munge_attributes = ['ClusterId','ProcId','JobStatus','UserLog','RemoteHost',
+  'LastRemoteHost','NumJobStarts','CumulativeSlotTime','RemoteUserCpu',
+  'CumulativeRemoteUserCpu','wallhr','eff','ceff','generator','versions']
+
+def get_attributes(keys):
+  '''Expand job parameters into the ClassAd attributes they depend on'''
+  ret = set()
+  for key in keys:
+    if key in derived_attributes:
+      ret.update(get_attributes(derived_attributes[key]))
+    else:
+      ret.add(key)
+  return ret
 
 def get_jobs(args):
-  cm = condor.matching.CondorMatchers(args)
-  for condor_id,job in job_cache.items():
-    if cm.matches(job):
-      yield (condor_id, job)
+  '''Yield the (condor id, job) pairs accepted by the matchers'''
+  for row in condor.matching.CondorMatchers(args).select(job_cache):
+    yield (job_cache.keys[row], job_cache.view(row))
+
+def show(args):
+  x = collections.OrderedDict([(cid,job.to_dict()) for cid,job in get_jobs(args)])
+  print(json.dumps(x, **json_format))
+
+# ids and source ranks of jobs discarded by the matchers:
+discarded = {}
 
-def show():
-  print(json.dumps(job_cache, **json_format))
+# serializes insertion from concurrent queries:
+ingest_lock = threading.Lock()
 
-def add_json(cmd):
-  '''Add JSON condor data to local dictionary'''
-  global job_cache
-  response = None
+def add_job(x, args, matchers=None, rank=0):
+  '''Add one ClassAd dictionary to the job store, munge it, and tally it
+  if accepted by the matchers, else discard it again if it is new.  A job
+  seen twice, e.g. in both condor_q and condor_history, is resolved by the
+  rank of its source, with the later one winning for equal ranks.'''
+  if 'ClusterId' in x and 'ProcId' in x:
+    condor_id = '%d.%d'%(x['ClusterId'],x['ProcId'])
+    if discarded.get(condor_id, -1) > rank:
+      return
+    new = condor_id not in job_cache
+    if not new:
+      if job_cache.rank(condor_id) > rank:
+        return
+      if matchers is None or matchers.matches(job_cache[condor_id]):
+        tally(job_cache[condor_id], -1)
+    job = job_cache.add(condor_id, x, rank)
+    t = condor.profile.clock()
+    munge_job(job, args)
+    condor.profile.accumulate('ingest/munge', t)
+    if matchers is None or matchers.matches(job):
+      tally(job)
+    elif new:
+      discarded[condor_id] = rank
+      job_cache.pop()
+
+def add_classads(classads, args, rank=0):
+  '''Add each job from an iterable of ClassAd dictionaries'''
+  cm = condor.matching.CondorMatchers(args)
+  for x in condor.profile.iterate('parse', classads):
+    with ingest_lock:
+      t = condor.profile.clock()
+      add_job(x, args, cm, rank)
+      condor.profile.accumulate('ingest', t)
+
+def read_command(cmd):
+  '''Yield each ClassAd from a command's JSON output as it is parsed'''
+  proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
   try:
-    response = subprocess.check_output(cmd).decode('UTF-8')
-    if len(response) > 0:
-      for x in json.loads(response):
-        if 'ClusterId' in x and 'ProcId' in x:
-          job_cache['%d.%d'%(x['ClusterId'],x['ProcId'])] = x
-        else:
-          pass
-  except:
+    yield from condor.util.read_json(io.TextIOWrapper(proc.stdout, encoding='UTF-8'))
+    if proc.wait() != 0:
+      raise subprocess.CalledProcessError(proc.returncode, cmd)
+  except Exception as e:
     print('Error running command:  '+' '.join(cmd)+':')
-    print(response)
+    print(e)
     sys.exit(1)
+  finally:
+    if proc.poll() is None:
+      proc.kill()
+
+def add_json(cmd, args, rank=0):
+  '''Add JSON condor data from a command's output to the local job store'''
+  add_classads(read_command(cmd), args, rank)
 
 def read(args):
-  global job_cache
-  data = json.load(open(args.input,'r'))
-  if type(data) is list:
-    for x in data:
-      if 'ClusterId' in x and 'ProcId' in x:
-        job_cache['%d.%d'%(x['ClusterId'],x['ProcId'])] = x
-  elif type(data) is dict:
-    job_cache = data
+  '''Load jobs from a JSON list or dictionary of ClassAds, or from a
+  snapshot of the job store written by -save, which needs no munging'''
+  if condor.snapshot.is_snapshot(args.input):
+    with condor.profile.stage('snapshot', lambda: len(job_cache)):
+      condor.snapshot.load(job_cache, args.input)
+      retally(args)
   else:
-    raise TypeError()
-  munge(args)
-
-def munge(args):
-  '''Assign custom parameters based on parsing some condor parameters'''
-  for condor_id,job in job_cache.items():
-    job.update({'user':None,'gemc':None,'host':None,'condor':None,'stderr':None,'stdout':None,'eff':None,'ceff':None})
-    job['generator'] = get_generator(job)
-    job['versions'] = get_versions(job)
-    job['wallhr'] = calc_wallhr(job)
-    job['condorid'] = '%d.%d'%(job['ClusterId'],job['ProcId'])
-    job['gemcjob'] = '.'.join(job.get('Args').split()[0:2])
-    # setup clas12 job ids and usernames:
-    if 'UserLog' in job:
-      m = re.search(log_regex, job['UserLog'])
-      if m is not None:
-        job['user'] = m.group(1)
-        job['gemc'] = m.group(2)
-        job['condor'] = m.group(3)+'.'+m.group(4)
-        job['stderr'] = job['UserLog'][0:-4]+'.err'
-        job['stdout'] = job['UserLog'][0:-4]+'.out'
-        if condor_id != job['condor']:
-          raise ValueError('condor ids do not match.')
-    # trim hostnames to the important bit:
-    if job.get('RemoteHost') is not None:
-      job['host'] = job.get('RemoteHost').split('@').pop()
-    if job.get('LastRemoteHost') is not None:
-      job['LastRemoteHost'] = job.get('LastRemoteHost').split('@').pop().split('.').pop(0)
-    # calculate cpu utilization for good, completed jobs:
-    if job_states[job['JobStatus']] == 'C' and  float(job.get('wallhr')) > 0:
-        job['eff'] = '%.2f'%(float(job.get('RemoteUserCpu')) / float(job.get('wallhr'))/60/60)
-    # calculate cumulative cpu efficiency for all jobs:
-    if job.get('CumulativeSlotTime') > 0:
-      if job_states[job['JobStatus']] == 'C' or job_states[job['JobStatus']] == 'R':
-        job['ceff'] = '%.2f'%(float(job.get('RemoteUserCpu'))/job.get('CumulativeSlotTime'))
-      else:
-        job['ceff'] = 0
-    # get stuff from log files (if unavailable from condor):
-    if args.perf:
-      if job_states[job['JobStatus']] == 'H':
-        job['ExitCode'] = get_exit_code(job)
-      elif job_states[job['JobStatus']] == 'C':
-        job['benchmark'] = get_benchmarks(job)
-    tally(job)
+    if args.json:
+      job_cache.retain()
+    open_cluster_cache(args)
+    with open(args.input,'r') as f:
+      add_classads(condor.util.read_json(f), args)
+    close_cluster_cache()
+  analyze_logs(args)
+
+def munge_job(job, args):
+  '''Assign custom parameters to one job'''
+  for x in ('user','gemc','host','eff','ceff'):
+    job[x] = None
+  x = get_cluster(job)
+  job['generator'] = x['generator']
+  job['versions'] = x['versions']
+  job['wallhr'] = calc_wallhr(job)
+  # setup clas12 job ids and usernames:
+  if 'UserLog' in job:
+    m = re.search(log_regex, job['UserLog'])
+    if m is not None:
+      if job['condorid'] != m.group(3)+'.'+m.group(4):
+        raise ValueError('condor ids do not match.')
+      job['user'] = m.group(1)
+      job['gemc'] = m.group(2)
+  # trim hostnames to the important bit:
+  if job.get('RemoteHost') is not None:
+    job['host'] = job.get('RemoteHost').split('@').pop()
+  if job.get('LastRemoteHost') is not None:
+    job['LastRemoteHost'] = job.get('LastRemoteHost').split('@').pop().split('.').pop(0)
+  # calculate cpu utilization for good, completed jobs:
+  if job_states[job['JobStatus']] == 'C' and  float(job.get('wallhr',0)) > 0:
+      job['eff'] = float(job.get('RemoteUserCpu')) / float(job.get('wallhr'))/60/60
+  # calculate cumulative cpu efficiency for all jobs:
+  if job.get('CumulativeSlotTime',0) > 0:
+    if job_states[job['JobStatus']] == 'C' or job_states[job['JobStatus']] == 'R':
+      job['ceff'] = float(job.get('RemoteUserCpu'))/job.get('CumulativeSlotTime')
+    else:
+      job['ceff'] = 0
 
-def tally(job):
-  '''Increment total good/bad job counts and times'''
+def tally(job, sign=1):
+  '''Increment total good/bad job counts and times, or
+  decrement them if sign is negative'''
   global job_tallies
   x = job_tallies
   if job_states[job['JobStatus']] == 'C' or job_states[job['JobStatus']] == 'R':
     if job['NumJobStarts'] > 0:
-      x['attempts'].append(job['NumJobStarts'])
+      x['attempts'] += sign*job['NumJobStarts']
+      x['nattempts'] += sign
     if job_states[job['JobStatus']] == 'C':
-      x['goodattempts'] += 1
-      x['goodwall'] += float(job['wallhr'])*60*60
-      x['goodcpu'] += job['RemoteUserCpu']
+      x['goodattempts'] += sign
+      x['goodwall'] += sign*float(job['wallhr'])*60*60
+      x['goodcpu'] += sign*job['RemoteUserCpu']
     if job['NumJobStarts'] > 1:
-      x['badattempts'] += job['NumJobStarts'] - 1
-      x['badwall'] += job['CumulativeSlotTime'] - float(job['wallhr'])*60*60
-      x['badcpu'] += job['CumulativeRemoteUserCpu'] - job['RemoteUserCpu']
+      x['badattempts'] += sign*(job['NumJobStarts'] - 1)
+      x['badwall'] += sign*(job['CumulativeSlotTime'] - float(job['wallhr'])*60*60)
+      x['badcpu'] += sign*(job['CumulativeRemoteUserCpu'] - job['RemoteUserCpu'])
   elif job['NumJobStarts'] > 0 and job_states[job['JobStatus']] != 'X':
-      x['badattempts'] += job['NumJobStarts']
-      x['badwall'] += job['CumulativeSlotTime']
-      x['badcpu'] += job['CumulativeRemoteUserCpu']
+      x['badattempts'] += sign*job['NumJobStarts']
+      x['badwall'] += sign*job['CumulativeSlotTime']
+      x['badcpu'] += sign*job['CumulativeRemoteUserCpu']
   x['totalwall'] = x['badwall'] + x['goodwall']
   x['totalcpu'] = x['badcpu'] + x['goodcpu']
 
+def retally(args):
+  '''Recompute the tallies from the jobs selected by args, e.g. for a
+  query of a resident job store that was tallied for a wider selection'''
+  for k in job_tallies:
+    job_tallies[k] = 0
+  for cid,job in get_jobs(args):
+    tally(job)
+
+def reset():
+  '''Empty the job store and its tallies, e.g. before refreshing it'''
+  job_cache.clear()
+  discarded.clear()
+  clusters.clear()
+  for k in job_tallies:
+    job_tallies[k] = 0
+
 def calc_wallhr(job):
   '''Calculate the wall hours of the final, completed instance of a job,
   because it does not seem to be directly available from condor.  This may
@@ -153,101 +315,196 @@ def get_status_key(job):
   d = {'H':'held','I':'idle','R':'run','C':'done'}
   return d.get(job_states[job['JobStatus']],'other')
 
-def cluster_summary(args):
-  '''Tally jobs by condor's ClusterId'''
-  ret = collections.OrderedDict()
+def summary_keys(table):
+  '''Job attributes to copy into a summary group, i.e. those displayed'''
+  return [x.varname for x in table.columns if x.varname in job_cache.columns]
+
+class Rollup():
+  '''Running totals for a group of jobs, keeping just the row of its
+  first job for the displayed attributes rather than a copy of it'''
+  __slots__ = ('row','counts','att','eff','ceff','wallhr','benchmarks')
+  def __init__(self, row):
+    self.row = row
+    self.counts = job_counts.copy()
+    self.att = condor.table.Accumulator()
+    self.eff = condor.table.Accumulator()
+    self.ceff = condor.table.Accumulator()
+    self.wallhr = condor.table.Accumulator()
+    self.benchmarks = condor.table.VectorAccumulator(len(tasks))
+
+def aggregate(args, rollups=('clusters','sites','exits','attempts')):
+  '''Compute the requested rollups of the selected jobs in a single scan:
+  a Rollup per cluster and per site, the number of jobs per exit code, and
+  a histogram of the number of attempts per job'''
+  clusters = collections.OrderedDict() if 'clusters' in rollups else None
+  sites = collections.OrderedDict() if 'sites' in rollups else None
+  exits = collections.OrderedDict() if 'exits' in rollups else None
+  attempts = collections.Counter() if 'attempts' in rollups else None
   for condor_id,job in get_jobs(args):
-    cluster_id = condor_id.split('.').pop(0)
-    if cluster_id not in ret:
-      ret[cluster_id] = job.copy()
-      ret[cluster_id].update(job_counts.copy())
-      ret[cluster_id]['eff'] = []
-      ret[cluster_id]['ceff'] = []
-      ret[cluster_id]['att'] = []
-      ret[cluster_id]['wallhr'] = []
-      ret[cluster_id]['benchmarks'] = []
-    ret[cluster_id][get_status_key(job)] += 1
-    ret[cluster_id]['done'] = ret[cluster_id]['TotalSubmitProcs']
-    ret[cluster_id]['done'] -= ret[cluster_id]['held']
-    ret[cluster_id]['done'] -= ret[cluster_id]['idle']
-    ret[cluster_id]['done'] -= ret[cluster_id]['run']
-    try:
-      if job['NumJobStarts'] > 0:
-        ret[cluster_id]['att'].append(job['NumJobStarts'])
-      x = float(job['eff'])
-      ret[cluster_id]['eff'].append(x)
-      x = float(job['ceff'])
-      ret[cluster_id]['ceff'].append(x)
-    except:
-      pass
-    if args.running or job_states[job['JobStatus']] == 'C':
+    status = get_status_key(job)
+    completed = job_states[job['JobStatus']] == 'C'
+    if clusters is not None:
+      cluster_id = condor_id.split('.').pop(0)
+      x = clusters.get(cluster_id)
+      if x is None:
+        x = clusters[cluster_id] = Rollup(job.row)
+      x.counts[status] += 1
       try:
-        x = float(job.get('wallhr'))
-        ret[cluster_id]['wallhr'].append(x)
+        if job['NumJobStarts'] > 0:
+          x.att.add(job['NumJobStarts'])
+        x.eff.add(float(job['eff']))
+        x.ceff.add(float(job['ceff']))
       except:
         pass
-    if job_states[job['JobStatus']] == 'C':
-      ret[cluster_id]['benchmarks'].append(job.get('benchmark')['list'])
-  for v in ret.values():
-    v['eff'] = condor.table.average(v['eff'])
-    v['ceff'] = condor.table.average(v['ceff'])
-    v['att'] = condor.table.average(v['att'])
-    v['ewallhr'] = condor.table.stddev(v['wallhr'])
-    v['wallhr'] = condor.table.average(v['wallhr'])
-    v['benchmarks'] = condor.table.average(v['benchmarks'])
-  return ret
-
-def site_summary(args):
-  '''Tally jobs by site.  Note, including completed jobs
-  here is only possible if condor_history is included.'''
-  sites = collections.OrderedDict()
-  for condor_id,job in get_jobs(args):
-    site = job.get('MATCH_GLIDEIN_Site')
-    if site not in sites:
-      sites[site] = job.copy()
-      sites[site].update(job_counts.copy())
-      sites[site]['wallhr'] = []
-      sites[site]['benchmarks'] = []
-    sites[site]['total'] += 1
-    sites[site][get_status_key(job)] += 1
-    if args.running or job_states[job['JobStatus']] == 'C':
+      if args.running or completed:
+        try:
+          x.wallhr.add(float(job.get('wallhr')))
+        except:
+          pass
+      if completed and job.get('benchmark') is not None:
+        x.benchmarks.add(job.get('benchmark')['list'])
+    if sites is not None:
+      site = job.get('MATCH_GLIDEIN_Site')
+      x = sites.get(site)
+      if x is None:
+        x = sites[site] = Rollup(job.row)
+      x.counts['total'] += 1
+      x.counts[status] += 1
+      if args.running or completed:
+        try:
+          x.wallhr.add(float(job.get('wallhr')))
+        except:
+          pass
+        if job.get('benchmark') is not None:
+          x.benchmarks.add(job.get('benchmark')['list'])
+    if exits is not None:
+      if job.get('ExitCode') is not None:
+        exits[job.get('ExitCode')] = exits.get(job.get('ExitCode'), 0) + 1
+    if attempts is not None:
       try:
-        x = float(job.get('wallhr'))
-        sites[site]['wallhr'].append(x)
+        n = int(job['NumJobStarts'])
+        if n > 0:
+          attempts[n] += 1
       except:
         pass
-      sites[site]['benchmarks'].append(job.get('benchmark')['list'])
-  for site in sites.keys():
-    sites[site]['ewallhr'] = condor.table.stddev(sites[site]['wallhr'])
-    sites[site]['wallhr'] = condor.table.average(sites[site]['wallhr'])
-    sites[site]['benchmarks'] = condor.table.average(sites[site]['benchmarks'])
+  return {'clusters':clusters, 'sites':sites, 'exits':exits, 'attempts':attempts}
+
+def cluster_summary(args, clusters=None):
+  '''Tally jobs by condor's ClusterId, from aggregate()'s rollups'''
+  if clusters is None:
+    clusters = aggregate(args, ['clusters'])['clusters']
+  keys = summary_keys(condor.table.summary_table)
+  ret = collections.OrderedDict()
+  for cluster_id,x in clusters.items():
+    v = ret[cluster_id] = job_cache.view(x.row).project(keys)
+    v.update(x.counts)
+    v['done'] = v['TotalSubmitProcs'] - v['held'] - v['idle'] - v['run']
+    v['eff'] = condor.table.average(x.eff)
+    v['ceff'] = condor.table.average(x.ceff)
+    v['att'] = condor.table.average(x.att)
+    v['ewallhr'] = condor.table.stddev(x.wallhr)
+    v['wallhr'] = condor.table.average(x.wallhr)
+    v['benchmarks'] = condor.table.average(x.benchmarks)
+  return ret
+
+def site_summary(args, sites=None):
+  '''Tally jobs by site, from aggregate()'s rollups.  Note, including
+  completed jobs here is only possible if condor_history is included.'''
+  if sites is None:
+    sites = aggregate(args, ['sites'])['sites']
+  keys = summary_keys(condor.table.site_table)
+  ret = collections.OrderedDict()
+  for site,x in sites.items():
+    v = ret[site] = job_cache.view(x.row).project(keys)
+    v.update(x.counts)
+    v['ewallhr'] = condor.table.stddev(x.wallhr)
+    v['wallhr'] = condor.table.average(x.wallhr)
+    v['benchmarks'] = condor.table.average(x.benchmarks)
     if args.hours <= 0:
-      sites[site]['done'] = condor.table.null_field
-  return condor.util.sort_dict(sites, 'total')
+      v['done'] = condor.table.null_field
+  return condor.util.sort_dict(ret, 'total')
 
-def exit_code_summary(args):
-  x = {}
-  for cid,job in get_jobs(args):
-    if job.get('ExitCode') is not None:
-      if job.get('ExitCode') not in x:
-        x[job.get('ExitCode')] = 0
-      x[job.get('ExitCode')] += 1
-  tot = sum(x.values())
+def exit_code_summary(args, exits=None):
+  if exits is None:
+    exits = aggregate(args, ['exits'])['exits']
+  tot = sum(exits.values())
   ret = '\nExit Code Summary:\n'
   ret += '------------------------------------------------\n'
-  ret += '\n'.join(['%4s  %8d %6.2f%%  %s'%(k,v,v/tot*100,exit_codes.get(k)) for k,v in x.items()])
+  ret += '\n'.join(['%4s  %8d %6.2f%%  %s'%(k,v,v/tot*100,exit_codes.get(k)) for k,v in exits.items()])
   return ret + '\n'
 
+def transitions(args, path):
+  '''Compare the selected jobs with those in a snapshot written by -save,
+  via a keyed merge on condor id, and get the snapshot's time, the number
+  of jobs per state transition, e.g. 'I->R', per site and transition, and
+  per new cluster.  Jobs appearing since are from 'new', and selected
+  jobs in the snapshot not in the job store anymore are to 'gone'.'''
+  old = new_job_table()
+  header = condor.snapshot.load(old, path)
+  counts = collections.Counter()
+  sites = collections.OrderedDict()
+  clusters = collections.OrderedDict()
+  def add(before, after, site):
+    x = before+'->'+after
+    counts[x] += 1
+    sites.setdefault(site, collections.Counter())[x] += 1
+  old_status = old.columns['JobStatus']
+  old_site = old.columns['MATCH_GLIDEIN_Site']
+  old_clusters = set(old.columns['ClusterId'].data)
+  rows = condor.matching.CondorMatchers(args).select(job_cache)
+  for key,status,site,cluster in zip([job_cache.keys[row] for row in rows],
+      job_cache.take('JobStatus',rows), job_cache.take('MATCH_GLIDEIN_Site',rows),
+      job_cache.take('ClusterId',rows)):
+    if cluster not in old_clusters:
+      clusters[cluster] = clusters.get(cluster, 0) + 1
+    row = old.index.get(key)
+    before = 'new' if row is None else job_states.get(old_status.get(row))
+    after = job_states.get(status)
+    if before != after:
+      if site is None and row is not None:
+        site = old_site.get(row)
+      add(before, after, site)
+  for row in condor.matching.CondorMatchers(args).select(old):
+    if old.keys[row] not in job_cache:
+      add(job_states.get(old_status.get(row)), 'gone', old_site.get(row))
+  return header['time'], counts, sites, clusters
+
+def transition_summary(args, path):
+  '''Tabulate transitions() overall, by site, and the new clusters'''
+  since, counts, sites, clusters = transitions(args, path)
+  since = datetime.datetime.fromtimestamp(since).strftime('%Y/%m/%d %H:%M:%S')
+  ret = '\nState Transitions since %s:\n'%since
+  ret += '------------------------------------------------\n'
+  ret += ''.join(['%-10s %8d\n'%(k,v) for k,v in counts.most_common()])
+  if len(counts) > 0:
+    table = condor.table.Table()
+    table.add_column(condor.table.Column('site',26))
+    for k,v in counts.most_common():
+      table.add_column(condor.table.Column(k,max(6,len(k)),tally='sum'))
+    for site,x in sorted(sites.items(), key=lambda x: -sum(x[1].values())):
+      table.add_row([site if site is not None else condor.table.null_field]
+        + [x.get(k,0) for k,v in counts.most_common()])
+    ret += '\nState Transitions by Site:\n' + str(table) + '\n'
+  if len(clusters) > 0:
+    ret += '\nNew Clusters:\n'
+    ret += '------------------------------------------------\n'
+    ret += ''.join(['%-10s %8d jobs\n'%(k,v) for k,v in clusters.items()])
+  return ret
+
 def efficiency_summary():
   global job_tallies
   x = job_tallies
   ret = ''
-  if len(x['attempts']) > 0:
+  # e.g. for -held, there are only the bad attempts of matching jobs:
+  if x['nattempts'] > 0 or x['badattempts'] > 0:
     ret += '\nEfficiency Summary:\n'
     ret += '------------------------------------------------\n'
     ret += 'Number of Good Job Attempts:  %10d\n'%x['goodattempts']
     ret += 'Number of Bad Job Attempts:   %10d\n'%x['badattempts']
-    ret += 'Average # of Job Attempts:    % 10.1f\n'%(sum(x['attempts'])/len(x['attempts']))
+    if x['nattempts'] > 0:
+      ret += 'Average # of Job Attempts:    % 10.1f\n'%(x['attempts']/x['nattempts'])
+    else:
+      ret += 'Average # of Job Attempts:    %10s\n'%'-'
     ret += '------------------------------------------------\n'
     ret += 'Total Wall and Cpu Hours:   %.3e %.3e\n'%(x['totalwall'],x['totalcpu'])
     ret += 'Bad Wall and Cpu Hours:     %.3e %.3e\n'%(x['badwall'],x['badcpu'])
@@ -261,6 +518,45 @@ def efficiency_summary():
     ret += '------------------------------------------------\n\n'
   return ret
 
+def read_logs(job, perf, cvmfs, cache=None, cached={}):
+  '''Get stuff from a job's log files (if unavailable from condor),
+  optionally via a condor.logcache.LogCache and its lookup() results'''
+  def get(path, name, func):
+    if cache is None:
+      return func(job)
+    return cache.get(cached, path, name, func, job)
+  ret = {}
+  if perf:
+    if job_states[job['JobStatus']] == 'H':
+      ret['ExitCode'] = get(job.get('stderr'), 'ExitCode', get_exit_code)
+    elif job_states[job['JobStatus']] == 'C':
+      ret['benchmark'] = get(job.get('stdout'), 'benchmark', get_benchmarks)
+  if cvmfs:
+    ret['cvmfs'] = get(job.get('stdout'), 'cvmfs', lambda job: not check_cvmfs(job))
+  return ret
+
+def analyze_logs(args):
+  '''Read the log files of the selected jobs with a pool of threads,
+  reusing results cached from previous runs for unchanged logs, and
+  store the results in the job store'''
+  if args.perf or args.cvmfs:
+    jobs = []
+    cache, cached = None, {}
+    with condor.profile.stage('logs', lambda: len(jobs)):
+      jobs = [job for cid,job in get_jobs(args)]
+      if args.logcache:
+        cache = condor.logcache.LogCache(args.logcache)
+        cached = cache.lookup([x for job in jobs for x in (job.get('stdout'),job.get('stderr'))])
+      f = lambda job: read_logs(job, args.perf, args.cvmfs, cache, cached)
+      for job,result in condor.pool.imap_unordered(f, jobs, args.threads):
+        if result is not None:
+          job.update(result)
+      if cache is not None:
+        cache.save()
+        cache.close()
+    if cache is not None:
+      condor.profile.note('logs', **cache.counts)
+
 def check_cvmfs(job):
   '''Return wether a CVMFS error is detected'''
   for line in condor.util.readlines_reverse(job.get('stdout'),20):
@@ -286,117 +582,122 @@ def get_exit_code(job):
         pass
   return None
 
-tasks = ['gen','gemc','bg','dn','rec']
-labels = {'gen':'GENERATOR','gemc':'GEMC','bg':'BG-MERGING','dn':'DE-NOISING','rec':'RECONSTRUCTION'}
+benchmark_regex = re.compile('(%s) (.*): (\d+)' % '|'.join([re.escape(labels[t]) for t in tasks]))
+label_tasks = {labels[t]:t for t in tasks}
+
 def get_benchmarks(job):
+  '''Get the wall hours of each phase from the START/END timestamps in
+  the job's stdout, in a single pass that stops once reconstruction has
+  ended and no other phase is still open'''
   x = dict(zip(tasks,[0]*len(tasks)))
   for line in condor.util.readlines(job.get('stdout')):
-    for t in tasks:
-      l = f'{labels[t]} (.*): (\d+)'
-      m = re.search(l,line)
-      if m is not None:
-        if m.group(1) == 'START':
-          x[t] = -int(m.group(2))
-        elif m.group(1) == 'END' and x[t] != 0:
-          x[t] = (int(m.group(2)) + int(x[t])) / 60 / 60
-#    if x['rec'] > 0:
-#      break
+    if 'START:' not in line and 'END:' not in line:
+      continue
+    m = benchmark_regex.search(line)
+    if m is not None:
+      t = label_tasks[m.group(1)]
+      if m.group(2) == 'START':
+        x[t] = -int(m.group(3))
+      elif m.group(2) == 'END' and x[t] != 0:
+        x[t] = (int(m.group(3)) + int(x[t])) / 60 / 60
+        if t == 'rec' and min(x.values()) >= 0:
+          break
   x['list'] = [x['gen'],x['gemc'],x['bg'],x['dn'],x['rec']]
   x['str'] = '%.1f/%.1f/%.1f/%.1f/%.1f' % (x['gen'],x['gemc'],x['bg'],x['dn'],x['rec'])
   return x
 
-versions = {}
-def get_versions(job):
-  cid = job.get('ClusterId')
-  if cid not in versions:
-    versions[cid] = condor.table.null_field 
-    if job.get('UserLog') is not None:
-      job_script = os.path.dirname(os.path.dirname(job.get('UserLog')))+'/nodeScript.sh'
-      for line in condor.util.readlines(job_script):
-          if line.find('module load gemc') >= 0:
-            m = re.search('module load (gemc/.*)',line.lower())
-            if m is not None:
-              versions[cid] = m.group(1)
-              break
-  return versions.get(cid)
-
-# cache generator names to only parse log once per cluster
-generators = {}
-def get_generator(job):
+generator_regex = re.compile('events with generator (.*) with options')
+versions_regex = re.compile('module load (gemc/.*)')
+
+def parse_script(path):
+  '''Get the generator name and gemc version from a cluster's job
+  script, in a single pass that stops once both are found'''
+  generator, versions = None, None
+  for line in condor.util.readlines(path):
+    if versions is None and line.find('module load gemc') >= 0:
+      m = versions_regex.search(line.lower())
+      if m is not None:
+        versions = m.group(1)
+    if generator is None:
+      line = line.lower()
+      m = generator_regex.search(line)
+      if m is not None:
+        if m.group(1).startswith('clas12-'):
+          generator = m.group(1)[7:]
+        else:
+          generator = m.group(1)
+      elif line.find('echo lund event file:') == 0:
+        generator = 'lund'
+      elif line.find('gemc') == 0 and line.find('INPUT') < 0:
+        generator = 'gemc'
+    if generator is not None and versions is not None:
+      break
+  return {'generator': condor.table.null_field if generator is None else generator,
+          'versions': condor.table.null_field if versions is None else versions}
+
+# cache cluster metadata to only parse the job script once per cluster,
+# also across runs via a condor.clustercache.ClusterCache if opened:
+clusters = {}
+cluster_cache = None
+
+def open_cluster_cache(args):
+  global cluster_cache
+  if args.clustercache:
+    cluster_cache = condor.clustercache.ClusterCache(args.clustercache)
+
+def close_cluster_cache():
+  global cluster_cache
+  if cluster_cache is not None:
+    cluster_cache.save()
+    condor.profile.note('ingest/munge', **cluster_cache.counts)
+    cluster_cache.close()
+    cluster_cache = None
+
+def get_cluster(job):
   cid = job.get('ClusterId')
-  if cid not in generators:
-    generators[cid] = condor.table.null_field
+  if cid not in clusters:
+    script = None
     if job.get('UserLog') is not None:
-      job_script = os.path.dirname(os.path.dirname(job.get('UserLog')))+'/nodeScript.sh'
-      for line in condor.util.readlines(job_script):
-        line = line.lower()
-        m = re.search('events with generator (.*) with options', line)
-        if m is not None:
-          if m.group(1).startswith('clas12-'):
-            generators[cid] = m.group(1)[7:]
-          else:
-            generators[cid] = m.group(1)
-          break
-        if line.find('echo lund event file:') == 0:
-          generators[cid] = 'lund'
-          break
-        if line.find('gemc') == 0 and line.find('INPUT') < 0:
-          generators[cid] = 'gemc'
-          break
-  return generators.get(cid)
+      script = os.path.dirname(os.path.dirname(job.get('UserLog')))+'/nodeScript.sh'
+    if cluster_cache is None or script is None:
+      clusters[cid] = parse_script(script)
+    else:
+      clusters[cid] = cluster_cache.get(cid, script, parse_script)
+  return clusters[cid]
 
 def _make_timeline_entry(args):
   data = {}
+  rollups = aggregate(args, ['clusters','sites','attempts'])
   summary = job_counts.copy()
-  for cid,job in condor.data.cluster_summary(args).items():
-    for x in summary.keys():
-      summary[x] += job[x]
+  for x in rollups['clusters'].values():
+    for k in summary.keys():
+      summary[k] += x.counts[k]
   summary.pop('done')
   summary.pop('total')
-  attempts = []
-  for condor_id,job in get_jobs(args):
-    try:
-      n = int(job['NumJobStarts'])
-      if n > 0:
-        attempts.append(n)
-    except:
-      pass
+  attempts = rollups['attempts']
   summary['attempts'] = 0
   if len(attempts) > 0:
-    summary['attempts'] = round(sum(attempts) / len(attempts),2)
+    summary['attempts'] = round(sum([k*v for k,v in attempts.items()]) / sum(attempts.values()),2)
   sites = {}
-  for site,val in condor.data.site_summary(args).items():
+  for site,x in rollups['sites'].items():
     if site is not None:
-      sites[site] = val['run']
+      sites[site] = x.counts['run']
   data['global'] = summary
   data['sites'] = sites
   data['update_ts'] = int(datetime.datetime.now().timestamp())
   return data
 
 def timeline(args):
-  basename = 'timeline.json'
-  srcdir = os.getenv('HOME')
-  destdir = 'dtn1902:/volatile/clas12/osg'
-  srcpath = '%s/%s'%(srcdir,basename)
-  destpath = '%s/%s'%(destdir,basename)
-  cache = []
-  perms = stat.S_IRWXU & (stat.S_IRUSR|stat.S_IWUSR)
-  perms |= stat.S_IRWXG & (stat.S_IRGRP)
-  perms |= stat.S_IRWXO & (stat.S_IROTH)
-  os.chmod(srcpath, perms)
-  if os.path.exists(srcpath) and os.access(srcpath, os.R_OK):
-    with open(srcpath,'r') as f:
-      cache = json.load(f)
-  cache.append(_make_timeline_entry(args))
-  if not os.path.exists(srcpath) or os.access(srcpath, os.W_OK):
-    with open(srcpath,'w') as f:
-      f.write(json.dumps(cache))
-  else:
-    print('Archive DNE or unwritable:  '+srcpath)
-    print(json.dumps(cache,**json_format))
+  '''Append an entry to the timeline archive and its rollups, compact it
+  if a month has ended, and ship the new data to the web host'''
+  archive = condor.timeline.Timeline()
+  archive.migrate()
+  entry = _make_timeline_entry(args)
+  archive.append(entry)
+  archive.update_rollups(entry)
+  archive.compact()
+  archive.write_index()
   try:
-    ret=subprocess.check_output(['scp',srcpath,destpath])
+    archive.ship()
   except:
     print('Failed to transfer timeline.')
-  os.chmod(srcpath,stat.S_IRWXU&(stat.S_IRUSR))
-
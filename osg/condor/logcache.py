@@ -0,0 +1,96 @@
+###
+### Persistent SQLite cache of metrics parsed from job log files, keyed by
+### path, size and modification time, since completed jobs' logs never change
+###
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+default_path = os.getenv('HOME','.')+'/.condor-logs.db'
+
+# entries for logs not looked up for this long are evicted:
+max_age_days = 7
+
+class LogCache():
+  '''Metrics for each log file, with hit/miss/eviction counts for this
+  process in counts and cumulative ones in the meta table'''
+  def __init__(self, path):
+    self.db = sqlite3.connect(path, timeout=300)
+    self.db.execute('CREATE TABLE IF NOT EXISTS logs (path TEXT PRIMARY KEY,'
+      ' size INTEGER, mtime REAL, seen INTEGER, metrics TEXT)')
+    self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+    self.db.commit()
+    self.counts = {'hits':0, 'misses':0, 'evictions':0}
+    self.saved = self.counts.copy()
+    self.updates = {}
+    self.used = set()
+    self.missing = set()
+    # guards the above against worker threads, including ones abandoned
+    # by condor.pool after a timeout, which may still finish during save():
+    self.lock = threading.Lock()
+  def lookup(self, paths):
+    '''Get the cached (size, mtime, metrics) for each of some paths'''
+    ret = {}
+    paths = [x for x in set(paths) if x is not None]
+    for i in range(0, len(paths), 500):
+      chunk = paths[i:i+500]
+      sql = 'SELECT path,size,mtime,metrics FROM logs WHERE path IN (%s)' % ','.join(['?']*len(chunk))
+      for path,size,mtime,metrics in self.db.execute(sql, chunk):
+        ret[path] = (size, mtime, json.loads(metrics))
+    return ret
+  def get(self, cached, path, name, func, *args):
+    '''Get one metric for a log file from the cache entries returned by
+    lookup(), else by calling func(*args).  The file is only stat'd, so
+    this may be called from worker threads, but the updates are only
+    written to the database by save().'''
+    try:
+      st = os.stat(path)
+    except (OSError, TypeError):
+      if path is not None:
+        with self.lock:
+          self.missing.add(path)
+      return func(*args)
+    key = (st.st_size, st.st_mtime)
+    with self.lock:
+      entry = self.updates.get(path, cached.get(path))
+      if entry is not None and entry[0:2] == key and name in entry[2]:
+        self.counts['hits'] += 1
+        self.used.add(path)
+        return entry[2][name]
+      self.counts['misses'] += 1
+    value = func(*args)
+    with self.lock:
+      entry = self.updates.get(path, cached.get(path))
+      metrics = dict(entry[2]) if entry is not None and entry[0:2] == key else {}
+      metrics[name] = value
+      self.updates[path] = key + (metrics,)
+    return value
+  def save(self):
+    '''Write new entries, refresh the ones used, and evict stale ones and
+    those whose logs no longer exist, e.g. after being transferred'''
+    now = int(time.time())
+    with self.lock:
+      used, updates, missing = self.used, self.updates, self.missing
+      self.updates = {}
+      self.used = set()
+      self.missing = set()
+    self.db.executemany('UPDATE logs SET seen=? WHERE path=?', [(now,x) for x in used])
+    self.db.executemany('INSERT OR REPLACE INTO logs VALUES (?,?,?,?,?)',
+      [(k,v[0],v[1],now,json.dumps(v[2])) for k,v in updates.items()])
+    x = self.db.executemany('DELETE FROM logs WHERE path=?', [(x,) for x in missing])
+    evictions = max(0, x.rowcount)
+    x = self.db.execute('DELETE FROM logs WHERE seen<?', (now-max_age_days*24*60*60,))
+    evictions += max(0, x.rowcount)
+    with self.lock:
+      self.counts['evictions'] += evictions
+      counts = self.counts.copy()
+    for k,v in counts.items():
+      self.db.execute('INSERT OR IGNORE INTO meta VALUES (?,0)', (k,))
+      self.db.execute('UPDATE meta SET value=value+? WHERE key=?', (v-self.saved[k],k))
+    self.db.commit()
+    self.saved = counts
+  def close(self):
+    self.db.close()
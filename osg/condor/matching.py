@@ -2,7 +2,25 @@
 ### Utilities for selecting HTCondor jobs
 ###
 
+import re
+
 import condor.data
+import condor.command
+
+def classad_string(value):
+  '''Quote a string as a ClassAd string literal'''
+  return '"%s"' % value.replace('\\','\\\\').replace('"','\\"')
+
+def classad_literal(value):
+  '''Convert a matcher value to a ClassAd literal'''
+  if re.fullmatch('-?[0-9]+', value) is not None:
+    return value
+  return classad_string(value)
+
+def classad_and(expressions):
+  expressions = [x for x in expressions if x is not None]
+  if len(expressions) > 0:
+    return ' && '.join(['(%s)'%x for x in expressions])
 
 class Matcher():
   def __init__(self, values):
@@ -29,24 +47,123 @@ class Matcher():
     return len(self.values)==0 or value is None
 
 class CondorMatcher(Matcher):
-  def __init__(self, values, key):
+  def __init__(self, values, key, attribute=None):
     self.key = key
+    self.attribute = attribute
     super().__init__(values)
+  def active(self):
+    return len(self.values) + len(self.antivalues) > 0
   def matches(self, job):
     return super().matches(job.get(self.key))
   def pattern_matches(self, job):
     return super().pattern_matches(job.get(self.key))
+  def constraint(self):
+    '''A ClassAd expression accepting at least the jobs accepted by
+    matches(), or None if there is no corresponding ClassAd attribute'''
+    if self.attribute is None:
+      return None
+    a = self.attribute
+    ret = ['%s =!= %s'%(a,classad_literal(v)) for v in self.antivalues]
+    if len(self.values) > 0:
+      x = ['%s =?= %s'%(a,classad_literal(v)) for v in self.values]
+      ret.append(' || '.join(['%s =?= undefined'%a] + x))
+    return classad_and(ret)
+  def pattern_constraint(self):
+    '''Same as constraint(), for pattern_matches(), i.e. the attribute's
+    value must be found in one of the matcher's values'''
+    if self.attribute is None:
+      return None
+    a = self.attribute
+    ret = ['isUndefined(%s) || !regexp(%s, %s)'%(a,a,classad_string(v)) for v in self.antivalues]
+    if len(self.values) > 0:
+      x = ['regexp(%s, %s)'%(a,classad_string(v)) for v in self.values]
+      ret.append(' || '.join(['isUndefined(%s)'%a] + x))
+    return classad_and(ret)
 
 class CondorMatchers():
   def __init__(self, args):
     self.args = args
-    self.exit = CondorMatcher(args.exit, 'ExitCode')
+    self.exit = CondorMatcher(args.exit, 'ExitCode', 'ExitCode')
     self.gemc = CondorMatcher(args.gemc, 'gemc')
     self.user = CondorMatcher(args.user, 'user')
-    self.site = CondorMatcher(args.site, 'MATCH_GLIDEIN_Site')
+    self.site = CondorMatcher(args.site, 'MATCH_GLIDEIN_Site', 'MATCH_GLIDEIN_Site')
     self.host = CondorMatcher(args.host, 'LastRemoteHost')
-    self.condor = CondorMatcher(args.condor, 'condor')
+    self.condor = CondorMatcher(args.condor, 'condor', 'ClusterId')
     self.generator = CondorMatcher(args.generator, 'generator')
+  def keys(self):
+    '''The job parameters used for matching'''
+    ret = ['condor','ExitCode','JobStatus','CompletionDate']
+    ret.extend([x.key for x in (self.gemc,self.user,self.site,self.host,self.generator)])
+    return ret
+  def log_constraint(self):
+    '''A ClassAd expression for the user and gemc id, which are parsed
+    from the UserLog path, including the requirement that they exist'''
+    pattern = lambda m,default: '(%s)'%'|'.join([re.escape(x) for x in m]) if len(m)>0 else default
+    ret = ['regexp(%s, UserLog)'%classad_string(condor.data.log_template %
+      (pattern(self.user.values,'[a-z]+'), pattern(self.gemc.values,'[0-9]+')))]
+    for x in self.user.antivalues:
+      ret.append('!regexp(%s, UserLog)'%classad_string(condor.data.log_template % (re.escape(x),'[0-9]+')))
+    for x in self.gemc.antivalues:
+      ret.append('!regexp(%s, UserLog)'%classad_string(condor.data.log_template % ('[a-z]+',re.escape(x))))
+    return classad_and(ret)
+  def constraint(self):
+    '''Compile the matchers into a ClassAd constraint expression, for
+    the schedd to apply, accepting at least every job matches() would.
+    Hosts are trimmed and generators come from the job script, so only
+    matches() can check those.'''
+    ret = [self.log_constraint()]
+    ret.append(self.condor.constraint())
+    ret.append(self.site.pattern_constraint())
+    # exit codes of held jobs may come from their logs instead:
+    exit = 'ExitCode =?= undefined' if self.args.noexit else self.exit.constraint()
+    if exit is not None and self.args.perf:
+      exit = 'JobStatus == 5 || (%s)'%exit
+    ret.append(exit)
+    if self.args.plot is False:
+      for state,code in (('idle',1),('running',2),('completed',4),('held',5)):
+        if getattr(self.args, state):
+          ret.append('JobStatus == %d'%code)
+    ret.append('CompletionDate =?= undefined || CompletionDate <= %d'%int(self.args.end.timestamp()))
+    return classad_and(ret)
+  def select(self, table):
+    '''Get the rows of a condor.store.JobTable accepted by matches(), in
+    order, via intersections of the table's column indexes, with only the
+    host and date checks done job by job'''
+    m = lambda matcher: (lambda x: Matcher.matches(matcher, x))
+    p = lambda matcher: (lambda x: Matcher.pattern_matches(matcher, x))
+    predicates = []
+    if self.args.noexit:
+      predicates.append(('ExitCode', lambda x: x is None))
+    predicates.append(('gemc', lambda x: x is not None))
+    if self.condor.active():
+      predicates.append(('ClusterId', lambda x: x is not None and Matcher.matches(self.condor, str(x))))
+    for matcher in (self.gemc, self.user, self.generator, self.exit):
+      if matcher.active():
+        predicates.append((matcher.key, m(matcher)))
+    if self.site.active():
+      predicates.append((self.site.key, p(self.site)))
+    if self.args.plot is False:
+      for state,code in (('idle','I'),('completed','C'),('running','R'),('held','H')):
+        if getattr(self.args, state):
+          predicates.append(('JobStatus', lambda x,code=code: condor.data.job_states.get(x) == code))
+    end = int(self.args.end.timestamp())
+    start = end - int(self.args.hours*60*60)
+    # only jobs from the sources args would query, e.g. if the table was
+    # filled for a wider selection by a resident condor.server:
+    sources = not self.args.input
+    queue = not self.args.completed or self.args.plot is not False
+    def residual(job):
+      if self.host.active() and not self.host.pattern_matches(job):
+        return False
+      if sources:
+        if table.row_rank(job.row) == condor.command.history_rank:
+          # jobs removed before completing have no CompletionDate:
+          if self.args.hours <= 0 or 0 < job.get('CompletionDate',0) < start:
+            return False
+        elif not queue:
+          return False
+      return job.get('CompletionDate') is None or job.get('CompletionDate') <= end
+    return table.select(predicates, residual)
   def matches(self, job):
     if self.args.noexit and job.get('ExitCode') is not None:
       return False
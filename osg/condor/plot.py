@@ -1,11 +1,155 @@
 ###
-### One giant function to plot various HTCondor job information
+### One giant function to plot various HTCondor job information, with
+### the histograms filled in batch independently of ROOT
 ###
 
 import sys
+import array
 import collections
 
 import condor.data
+import condor.matching
+
+# job parameters used for plotting:
+keys = ['generator','versions','JobStatus','NumJobStarts','eff','ceff',
+  'wallhr','CumulativeSlotTime','MATCH_GLIDEIN_Site']
+
+class Histogram():
+  '''A histogram with fixed-width bins in one or two dimensions, laid out
+  like ROOT's with underflow and overflow bins, and filled in batch from
+  lists of values, so that ROOT is only needed by to_root() for drawing'''
+  def __init__(self, name, title, nx, xmin, xmax, ny=0, ymin=0, ymax=0):
+    self.name = name
+    self.title = title
+    self.axes = [(nx,xmin,xmax)]
+    if ny > 0:
+      self.axes.append((ny,ymin,ymax))
+    self.contents = [0]*((nx+2)*(ny+2 if ny>0 else 1))
+    self.entries = 0
+    # sum of weights and their squares, then of w*x, w*x*x[, w*y, w*y*y, w*x*y]:
+    self.stats = [0.0]*(4 if ny == 0 else 7)
+  def clone(self, name, title=None):
+    '''Get an empty histogram with the same binning'''
+    x = [a for axis in self.axes for a in axis]
+    return Histogram(name, self.title if title is None else title, *x)
+  def find_bins(self, axis, values):
+    '''Get the bin numbers along one axis, the same as ROOT's TAxis::FindBin'''
+    n,lo,hi = self.axes[axis]
+    scale = n/(hi-lo)
+    return [0 if x < lo else n+1 if not x < hi else 1+int(scale*(x-lo)) for x in values]
+  def fill(self, xs, ys=None):
+    '''Fill with lists of x values, and of y values for 2D histograms, where
+    None values are skipped.  As in ROOT, entries include out-of-range
+    values but the statistics do not.'''
+    if ys is None:
+      xs = [x for x in xs if x is not None]
+      bins = self.find_bins(0, xs)
+      inside = [x for x,b in zip(xs,bins) if 0 < b <= self.axes[0][0]]
+      sums = [len(inside), len(inside), sum(inside), sum([x*x for x in inside])]
+    else:
+      xs,ys = [x for x,y in zip(xs,ys) if x is not None and y is not None],\
+              [y for x,y in zip(xs,ys) if x is not None and y is not None]
+      nx,ny = self.axes[0][0], self.axes[1][0]
+      bx,by = self.find_bins(0, xs), self.find_bins(1, ys)
+      bins = [x + (nx+2)*y for x,y in zip(bx,by)]
+      inside = [(x,y) for x,y,i,j in zip(xs,ys,bx,by) if 0 < i <= nx and 0 < j <= ny]
+      sums = [len(inside), len(inside), sum([x for x,y in inside]), sum([x*x for x,y in inside]),
+        sum([y for x,y in inside]), sum([y*y for x,y in inside]), sum([x*y for x,y in inside])]
+    for b,n in collections.Counter(bins).items():
+      self.contents[b] += n
+    self.entries += len(bins)
+    self.stats = [a+b for a,b in zip(self.stats,sums)]
+  def to_root(self, ROOT):
+    '''Copy into a new ROOT histogram'''
+    x = [a for axis in self.axes for a in axis]
+    h = (ROOT.TH1D if len(self.axes) == 1 else ROOT.TH2D)(self.name, self.title, *x)
+    for b,n in enumerate(self.contents):
+      if n != 0:
+        h.SetBinContent(b, n)
+    h.SetEntries(self.entries)
+    h.PutStats(array.array('d', self.stats))
+    return h
+
+def fill_groups(template, name, keys, xs, ys=None):
+  '''Get a clone of a template histogram for each distinct key, in order
+  of first appearance, filled with the values sharing that key'''
+  groups = collections.OrderedDict()
+  for i,k in enumerate(keys):
+    groups.setdefault(k, []).append(i)
+  ret = collections.OrderedDict()
+  for k,rows in groups.items():
+    ret[k] = template.clone(name % k)
+    ret[k].fill([xs[i] for i in rows], None if ys is None else [ys[i] for i in rows])
+  return ret
+
+def fill(args):
+  '''Compute all the histograms of the selected jobs in batch from the job
+  store's columns, returning them in a dictionary, with those grouped by
+  generator, site or version as dictionaries, plus the sets of generators
+  and versions'''
+  table = condor.data.job_cache
+  rows = condor.matching.CondorMatchers(args).select(table)
+  status = table.take('JobStatus', rows)
+  starts = table.take('NumJobStarts', rows)
+  gens = table.take('generator', rows)
+  h = collections.OrderedDict()
+  h['h1eff'] = Histogram('h1eff',';CPU Utilization',100,0,1.2)
+  h['h2eff'] = Histogram('h2eff',';Wall Hours;CPU Utilization',100,0,32,100,0,1.2)
+  h['h1ceff'] = Histogram('h1ceff',';Cumulative Efficiency',100,0,1.2)
+  h['h2ceff'] = Histogram('h2ceff',';Cumulative Wall Hours;Cumulative Efficiency',200,0,48,100,0,1.2)
+  h['h2att'] = Histogram('h2att',';Job Attempts;Cumulative Efficiency',16,0.5,16.5,100,0,1.2)
+  h['h1att'] = Histogram('h1att',';Job Attempts',16,0.5,16.5)
+  h['h1wall'] = Histogram('h1wall',';Wall Hours',100,0,32)
+  h['h1attq'] = h['h1att'].clone('h1attq',';Queued Job Attempts')
+
+  # attempts of jobs not yet completed:
+  queued = [i for i,x in enumerate(status) if condor.data.job_states.get(x) != 'C' and starts[i] is not None]
+  attq = [starts[i] for i in queued]
+  h['h1attq'].fill(attq)
+  h['h1attq_gen'] = fill_groups(h['h1attq'], 'h1attq_gen_%s', [gens[i] for i in queued], attq)
+
+  # completed jobs, whose (formatted) efficiencies are available:
+  eff = table.take('eff', rows)
+  done = [i for i,x in enumerate(eff) if x is not None]
+  ceff = table.take('ceff', rows)
+  wall = table.take('wallhr', rows)
+  slot = table.take('CumulativeSlotTime', rows)
+  ok = set([i for i in done if None not in (ceff[i],wall[i],slot[i],starts[i])])
+  def values(column, f=None):
+    # jobs without all values still define groups, but are not filled:
+    return [None if i not in ok else column[i] if f is None else f(column[i]) for i in done]
+  eff = values(eff, lambda x: round(x,2))
+  ceff = values(ceff, lambda x: round(x,2))
+  wall = values(wall, lambda x: round(x,2))
+  cwall = values(slot, lambda x: x/60/60)
+  att = values(starts)
+  gen = [gens[i] for i in done]
+  site = table.take('MATCH_GLIDEIN_Site', [rows[i] for i in done])
+  vers = table.take('versions', [rows[i] for i in done])
+  h['h1eff'].fill(eff)
+  h['h1ceff'].fill(ceff)
+  h['h1wall'].fill(wall)
+  h['h2eff'].fill(wall, eff)
+  h['h2ceff'].fill(cwall, ceff)
+  h['h2att'].fill(att, ceff)
+  h['h1att'].fill(att)
+  h['h1eff_gen'] = fill_groups(h['h1eff'], 'h1eff_gen_%s', gen, eff)
+  h['h1ceff_gen'] = fill_groups(h['h1ceff'], 'h1ceff_gen_%s', gen, ceff)
+  h['h1att_gen'] = fill_groups(h['h1att'], 'h1att_gen_%s', gen, att)
+  h['h1wall_gen'] = fill_groups(h['h1wall'], 'h1wall_gen_%s', gen, wall)
+  h['h1eff_site'] = fill_groups(h['h1eff'], 'h1eff_site_%s', site, eff)
+  h['h1ceff_site'] = fill_groups(h['h1ceff'], 'h1ceff_site_%s', site, ceff)
+  h['h1wall_site'] = fill_groups(h['h1wall'], 'h1wall_site_%s', site, wall)
+  h['h1wall_vers'] = fill_groups(h['h1wall'], 'h1wall_vers_%s', vers, wall)
+  h['generators'] = set(h['h1attq_gen'].keys()) | set(h['h1eff_gen'].keys())
+  h['versions'] = set(h['h1wall_vers'].keys())
+  return h
+
+def to_root(ROOT, x):
+  '''Convert a Histogram, or each in a dictionary of them, to ROOT'''
+  if isinstance(x, Histogram):
+    return x.to_root(ROOT)
+  return collections.OrderedDict([(k,v.to_root(ROOT)) for k,v in x.items()])
 
 # This is just to keep things in scope:
 root_store = []
@@ -19,6 +163,12 @@ def set_histos_max(histos):
     h.SetMaximum(hmax*1.1)
 
 def plot(args, logscale=0):
+  '''Fill and draw the histograms of the selected jobs, returning the canvas'''
+  return render(fill(args), logscale)
+
+def render(histos, logscale=0):
+  '''Draw histograms from fill() on a new canvas, with a log scale if
+  logscale is nonzero, returning the canvas'''
   # pyROOT apparently looks at sys.argv and barfs if it finds an argument
   # it doesn't like, maybe ones starting with "h" (help).  Hopefully there
   # is a better way, but here we override sys.argv, before importing ROOT:
@@ -63,87 +213,18 @@ def plot(args, logscale=0):
   can = ROOT.TCanvas('can','',1800,1000)
   can.Divide(4,3)
   can.Draw()
-  h1wall_site = {}
-  h1eff_gen = {}
-  h1eff_site = {}
-  h1ceff_gen = {}
-  h1ceff_site = {}
-  h1att_gen = {}
-  h1attq_gen = {}
-  h1wall_gen = {}
-  h1wall_vers = {}
-  h1eff = ROOT.TH1D('h1eff',';CPU Utilization',100,0,1.2)
-  h2eff = ROOT.TH2D('h2eff',';Wall Hours;CPU Utilization',100,0,32,100,0,1.2)
-  h1ceff = ROOT.TH1D('h1ceff',';Cumulative Efficiency',100,0,1.2)
-  h2ceff = ROOT.TH2D('h2ceff',';Cumulative Wall Hours;Cumulative Efficiency',200,0,48,100,0,1.2)
-  h2att = ROOT.TH2D('h2att',';Job Attempts;Cumulative Efficiency',16,0.5,16.5,100,0,1.2)
-  h1att = ROOT.TH1D('h1att',';Job Attempts',16,0.5,16.5)
-  h1wall = ROOT.TH1D('h1wall',';Wall Hours',100,0,32)
-  h1attq = h1att.Clone('h1attq')
-  h1attq.GetXaxis().SetTitle('Queued Job Attempts')
-  generators = set()
-  versions = set()
-
-  # read condor data, fill histos:
-  for condor_id,job in condor.data.get_jobs(args):
-    gen = job.get('generator')
-    if condor.data.job_states[job['JobStatus']] != 'C':
-      try:
-        n = int(job.get('NumJobStarts'))
-        h1attq.Fill(n)
-        if gen not in h1attq_gen:
-          h1attq_gen[gen] = h1attq.Clone('h1attq_gen_%s'%gen)
-          h1attq_gen[gen].Reset()
-          generators.add(gen)
-        h1attq_gen[gen].Fill(n)
-      except:
-        pass
-    if job.get('eff') is not None:
-      eff = float(job.get('eff'))
-      ceff = float(job.get('ceff'))
-      wall = float(job.get('wallhr'))
-      vers = job.get('versions')
-      cwall = float(job.get('CumulativeSlotTime'))/60/60
-      site = job.get('MATCH_GLIDEIN_Site')
-      if vers not in h1wall_vers:
-        h1wall_vers[vers] = h1wall.Clone('h1wall_vers_%s'%vers)
-        h1wall_vers[vers].Reset()
-        versions.add(vers)
-      if gen not in h1eff_gen:
-        h1eff_gen[gen] = h1eff.Clone('h1eff_gen_%s'%gen)
-        h1ceff_gen[gen] = h1ceff.Clone('h1ceff_gen_%s'%gen)
-        h1att_gen[gen] = h1att.Clone('h1att_gen_%s'%gen)
-        h1wall_gen[gen] = h1wall.Clone('h1wall_gen_%s'%gen)
-        h1eff_gen[gen].Reset()
-        h1ceff_gen[gen].Reset()
-        h1att_gen[gen].Reset()
-        h1wall_gen[gen].Reset()
-        generators.add(gen)
-      if site not in h1eff_site:
-        h1eff_site[site] = h1eff.Clone('h1eff_site_%s'%site)
-        h1ceff_site[site] = h1ceff.Clone('h1ceff_site_%s'%site)
-        h1wall_site[site] = h1wall.Clone('h1wall_site_%s'%site)
-        h1eff_site[site].Reset()
-        h1ceff_site[site].Reset()
-        h1wall_site[site].Reset()
-      try:
-        h1eff.Fill(eff)
-        h1ceff.Fill(ceff)
-        h1wall.Fill(wall)
-        h2eff.Fill(wall, eff)
-        h2ceff.Fill(cwall, ceff)
-        h2att.Fill(job.get('NumJobStarts'), ceff)
-        h1att.Fill(job.get('NumJobStarts'))
-        h1eff_gen[gen].Fill(eff)
-        h1att_gen[gen].Fill(job.get('NumJobStarts'))
-        h1eff_site[site].Fill(eff)
-        h1ceff_gen[gen].Fill(ceff)
-        h1ceff_site[site].Fill(ceff)
-        h1wall_site[site].Fill(wall)
-        h1wall_gen[gen].Fill(wall)
-        h1wall_vers[vers].Fill(wall)
-      except:
-        pass
+  generators = histos['generators']
+  versions = histos['versions']
+  histos = {k:to_root(ROOT, v) for k,v in histos.items() if k not in ('generators','versions')}
+  h1eff, h2eff = histos['h1eff'], histos['h2eff']
+  h1ceff, h2ceff = histos['h1ceff'], histos['h2ceff']
+  h1att, h2att = histos['h1att'], histos['h2att']
+  h1attq, h1wall = histos['h1attq'], histos['h1wall']
+  h1attq_gen, h1att_gen = histos['h1attq_gen'], histos['h1att_gen']
+  h1eff_gen, h1ceff_gen = histos['h1eff_gen'], histos['h1ceff_gen']
+  h1wall_gen, h1wall_vers = histos['h1wall_gen'], histos['h1wall_vers']
+  h1eff_site, h1ceff_site = histos['h1eff_site'], histos['h1ceff_site']
+  h1wall_site = histos['h1wall_site']
 
   # set y-limits on all histos so scale is good:
   set_histos_max([h1att,h1attq])
@@ -295,3 +376,25 @@ def plot(args, logscale=0):
 
   return can
 
+def logscale_path(path):
+  '''Get the output path for the log-scale variant of a plot'''
+  x = path.split('.')
+  return '.'.join(x[0:-1])+'-logscale.'+x[-1] if len(x) > 1 else path+'-logscale'
+
+def _save(histos, paths, logscale):
+  can = render(histos, logscale)
+  for path in paths:
+    can.SaveAs(logscale_path(path) if logscale else path)
+
+def save(histos, paths, logscales=(0,1), processes=1):
+  '''Render histograms from fill() once per scale, saving each rendering
+  to every path (e.g. one per format), with "-logscale" added to the names
+  of the log-scale ones, optionally rendering in parallel processes'''
+  if processes > 1 and len(logscales) > 1:
+    import multiprocessing
+    # spawn, so each process gets a fresh ROOT:
+    with multiprocessing.get_context('spawn').Pool(min(processes,len(logscales))) as pool:
+      pool.starmap(_save, [(histos, paths, x) for x in logscales])
+  else:
+    for x in logscales:
+      _save(histos, paths, x)
@@ -0,0 +1,72 @@
+###
+### Bounded thread pool for slow, I/O-bound work like reading job logs
+### on NFS, where individual calls may hang and must be abandoned
+###
+
+import time
+import queue
+import multiprocessing.pool
+
+# default number of threads and per-call timeout in seconds:
+default_threads = 8
+default_timeout = 60
+
+def imap_unordered(func, items, threads=default_threads, timeout=default_timeout):
+  '''Apply func to each item in parallel, yielding (item, result) pairs in
+  completion order.  A call that raises yields None, as does one running
+  longer than timeout seconds, whose (daemon) thread is then abandoned.'''
+  items = list(items)
+  if len(items) == 0:
+    return
+  results = queue.Queue()
+  # start times of the calls in progress, kept by the worker threads:
+  running = {}
+  def run(i):
+    running[i] = time.time()
+    try:
+      results.put((i, func(items[i])))
+    except Exception:
+      results.put((i, None))
+  threads = max(1, min(threads, len(items)))
+  pool = multiprocessing.pool.ThreadPool(threads)
+  for i in range(len(items)):
+    pool.apply_async(run, (i,))
+  pending = set(range(len(items)))
+  # abandoned calls still occupying a thread:
+  stuck = set()
+  try:
+    while len(pending) > 0:
+      try:
+        i,result = results.get(timeout=min(1,timeout))
+        running.pop(i, None)
+        stuck.discard(i)
+        if i in pending:
+          pending.remove(i)
+          yield (items[i], result)
+      except queue.Empty:
+        pass
+      # check deadlines every time, lest a trickle of results hide a hang:
+      now = time.time()
+      for i,t in list(running.items()):
+        if i in pending and now-t > timeout:
+          pending.remove(i)
+          stuck.add(i)
+          yield (items[i], None)
+      # give up on the rest if every thread is stuck:
+      if len(stuck) >= threads:
+        for i in sorted(pending):
+          yield (items[i], None)
+        pending.clear()
+  finally:
+    pool.terminate()
+
+def imap(func, items, threads=default_threads, timeout=default_timeout):
+  '''Same as imap_unordered, but yielding the results in order'''
+  items = list(items)
+  done = {}
+  n = 0
+  for i,result in imap_unordered(lambda i: func(items[i]), range(len(items)), threads, timeout):
+    done[i] = result
+    while n in done:
+      yield (items[n], done.pop(n))
+      n += 1
@@ -0,0 +1,222 @@
+###
+### The condor-probe command:  option checks, loading jobs (or querying a
+### resident condor.server instead), and reporting on them
+###
+
+import io
+import os
+import sys
+import shutil
+import datetime
+import contextlib
+
+import condor.data
+import condor.plot
+import condor.table
+import condor.server
+import condor.profile
+import condor.snapshot
+import condor.command
+from condor.cli import cli
+
+def check(args):
+  '''Validate the options and fill in their defaults'''
+
+  if args.xrootd:
+    args.perf = True
+
+  if args.held + args.idle + args.running + args.completed > 1:
+    cli.error('Only one of -held/idle/running/completed is allowed.')
+
+  if (bool(args.vacate>=0) + bool(args.tail is not None) + bool(args.cvmfs) + bool(args.json)) > 1:
+    cli.error('Only one of -cvmfs/vacate/tail/json is allowed.')
+
+  if args.completed and args.hours <= 0 and not args.input:
+    cli.error('-completed requires -hours is greater than zero or -input.')
+
+  if args.serve:
+    if args.input or args.plot is not False or args.timeline or args.end is not None or args.save or args.profile:
+      cli.error('-serve is incompatible with -input/plot/timeline/end/save/profile.')
+    if args.hold or args.vacate>=0 or args.tail is not None:
+      cli.error('-serve is incompatible with -hold/vacate/tail.')
+    if any([getattr(args,x) for x in condor.server.filters]):
+      cli.error('-serve keeps all jobs, so it cannot be limited by '+'/'.join(condor.server.filters)+'.')
+    if not args.socket:
+      cli.error('-serve requires -socket.')
+
+  if len(args.exit) > 0 and not args.perf:
+    print('Enabling -perf to accommodate -exit.  This may be slow ....')
+    args.perf = True
+
+  if args.plot and os.environ.get('DISPLAY') is None:
+    cli.error('-plot requires graphics, but $DISPLAY is not set.')
+
+  if args.end is None:
+    args.end = datetime.datetime.now()
+  else:
+    try:
+      args.end = datetime.datetime.strptime(args.end,'%Y/%m/%d_%H:%M:%S')
+    except:
+      try:
+        args.end = datetime.datetime.strptime(args.end,'%Y/%m/%d')
+      except:
+        cli.error('Invalid date format for -end:  '+args.end)
+
+def report(args):
+  '''Print the tables, summaries, etc., requested by args for the
+  jobs loaded in condor.data, or act on them'''
+
+  if args.timeline:
+    condor.data.timeline(args)
+    return
+
+  if args.json:
+    condor.data.show(args)
+    return
+
+  if args.diff:
+    print(condor.data.transition_summary(args, args.diff))
+    return
+
+  if args.plot is not False:
+    with condor.profile.stage('plot'):
+      histos = condor.plot.fill(args)
+    if args.plot is not True:
+      condor.plot.save(histos, args.plot.split(','))
+    else:
+      c = condor.plot.render(histos)
+      print('Done Plotting.  Press Return to close.')
+      input()
+    return
+
+  tails = []
+  holds = []
+  vacates = []
+  njobs = 0
+
+  if args.summary:
+    table = condor.table.summary_table.empty()
+  elif args.sitesummary:
+    table = condor.table.site_table.empty()
+  else:
+    table = condor.table.job_table.empty()
+  table.stream(sys.stdout, args.limit, args.page)
+
+  for cid,job in condor.profile.iterate('match', condor.data.get_jobs(args)):
+
+    if args.hold:
+      holds.append(job)
+
+    if args.vacate>0:
+      if job.get('wallhr') is not None:
+        if float(job.get('wallhr')) > args.vacate:
+          if condor.data.job_states.get(job['JobStatus']) == 'R':
+            vacates.append(job)
+
+    elif args.cvmfs:
+      if job.get('cvmfs'):
+        if 'LastRemoteHost' in job:
+          print(job.get('MATCH_GLIDEIN_Site')+' '+job['LastRemoteHost']+' '+cid)
+
+    elif args.xrootd:
+      if not condor.data.check_xrootd(job):
+        if 'LastRemoteHost' in job:
+          print(job.get('MATCH_GLIDEIN_Site')+' '+job['LastRemoteHost']+' '+cid)
+
+    elif args.tail is not None:
+      tails.append(job)
+
+    else:
+      njobs += 1
+      if not args.summary and not args.sitesummary:
+        t = condor.profile.clock()
+        table.add_job(job)
+        condor.profile.accumulate('render', t)
+
+  if args.tail is not None:
+    condor.table.tail_logs(tails, args.tail, args.threads)
+
+  if args.tail is None and not args.cvmfs:
+    if njobs > 0:
+      rollups = []
+      if args.summary:
+        rollups.append('clusters')
+      elif args.sitesummary:
+        rollups.append('sites')
+      if (args.held or args.idle) and args.perf:
+        rollups.append('exits')
+      with condor.profile.stage('aggregate'):
+        rollups = condor.data.aggregate(args, rollups)
+      with condor.profile.stage('render'):
+        if args.summary:
+          table.add_jobs(condor.data.cluster_summary(args, rollups['clusters']))
+        elif args.sitesummary:
+          table.add_jobs(condor.data.site_summary(args, rollups['sites']))
+        table.finish()
+        if (args.held or args.idle) and args.perf:
+          print(condor.data.exit_code_summary(args, rollups['exits']))
+        if args.hours>0:
+          print(condor.data.efficiency_summary())
+
+  # act on jobs in batches, after the scan and once the table is complete:
+  if len(holds) > 0:
+    condor.command.hold(holds, args.threads)
+
+  if len(vacates) > 0:
+    condor.command.vacate(vacates, args.threads)
+
+def answer(argv, served):
+  '''Answer a query from the resident job store of condor.server'''
+  args = cli.parse_args(argv)
+  reason = condor.server.unsupported(args, served)
+  if reason is not None:
+    raise condor.server.Unsupported(reason)
+  # the client already printed any warnings:
+  with contextlib.redirect_stdout(io.StringIO()):
+    check(args)
+  condor.data.retally(args)
+  report(args)
+
+def main(argv):
+
+  args = cli.parse_args(argv)
+  check(args)
+
+  if args.profile:
+    condor.profile.start()
+
+  if not args.serve and not args.input and args.socket:
+    with condor.profile.stage('request'):
+      output = condor.server.request(args.socket, argv)
+    if output is not None:
+      sys.stdout.write(output)
+      condor.profile.finish(args, argv)
+      return
+
+  if not args.input:
+    if shutil.which('condor_q') is None:
+      cli.error('You must be on an OSG submit node unless using the -input option.')
+
+  if args.plot is not False:
+    import ROOT
+
+  if args.serve:
+    condor.server.serve(args, answer)
+    return
+
+  if args.input:
+    with condor.profile.stage('read', lambda: len(condor.data.job_cache)):
+      condor.data.read(args)
+  else:
+    with condor.profile.stage('query', lambda: len(condor.data.job_cache)):
+      condor.command.query(args)
+
+  with condor.profile.stage('report'):
+    report(args)
+
+  # after the report, which may -diff against the same snapshot:
+  if args.save:
+    with condor.profile.stage('save', lambda: len(condor.data.job_cache)):
+      condor.snapshot.save(condor.data.job_cache, args.save)
+
+  condor.profile.finish(args, argv)
@@ -0,0 +1,157 @@
+###
+### Lightweight per-stage instrumentation for -profile:  wall and CPU
+### time, peak RSS and item counts, accumulated by stage, and nothing but
+### a flag check per call when disabled
+###
+
+import sys
+import json
+import time
+import datetime
+import resource
+import threading
+import contextlib
+
+enabled = False
+
+# records by stage path, e.g. query/ingest, in order of first use:
+records = {}
+
+# the enclosing stage() names, from the main thread:
+stack = []
+
+lock = threading.Lock()
+started = None
+
+def start():
+  global enabled, started
+  enabled = True
+  started = (time.perf_counter(), time.process_time())
+
+def _record(name):
+  path = '/'.join(stack+[name])
+  if path not in records:
+    records[path] = {'stage':path, 'wall':0.0, 'cpu':None, 'items':None, 'calls':0, 'maxrss':None}
+  return records[path]
+
+def clock():
+  '''Get the start time for a later accumulate(), if enabled'''
+  if enabled:
+    return time.perf_counter()
+
+def accumulate(name, t, items=1):
+  '''Add the wall time since clock() returned t, and items, to a stage
+  nested in the current one.  This is for work done item by item, maybe
+  from several threads, so CPU time and memory are left to the enclosing
+  stage, whose wall time it may exceed when summed over threads.'''
+  if t is not None:
+    _add(name, time.perf_counter()-t, items)
+
+def _add(name, wall, items, calls=1):
+  with lock:
+    x = _record(name)
+    x['wall'] += wall
+    x['calls'] += calls
+    if items is not None:
+      x['items'] = (x['items'] or 0) + items
+
+def iterate(name, items):
+  '''Yield from an iterable, accumulating the time spent getting each
+  item, e.g. reading and parsing it, to a stage once exhausted'''
+  if not enabled:
+    yield from items
+    return
+  # listed in order of first use, like other stages:
+  _add(name, 0.0, 0, 0)
+  wall, n = 0.0, 0
+  it = iter(items)
+  try:
+    while True:
+      t = time.perf_counter()
+      try:
+        x = next(it)
+      except StopIteration:
+        return
+      wall += time.perf_counter()-t
+      n += 1
+      yield x
+  finally:
+    _add(name, wall, n)
+
+def note(name, **kwargs):
+  '''Add counts, e.g. cache hits, to a stage'''
+  if enabled:
+    with lock:
+      x = _record(name)
+      for k,v in kwargs.items():
+        x[k] = x.get(k,0) + v
+
+@contextlib.contextmanager
+def stage(name, items=None):
+  '''Time a stage of the main thread, whose items may be given as a
+  function of the result, e.g. stage('query', lambda: len(jobs))'''
+  if not enabled:
+    yield
+    return
+  t0, c0 = time.perf_counter(), time.process_time()
+  x = _record(name)
+  # CPU time is partial, so omitted, if the stage was also accumulated:
+  cpu = x['calls'] == 0 or x['cpu'] is not None
+  stack.append(name)
+  try:
+    yield
+  finally:
+    stack.pop()
+    x['wall'] += time.perf_counter()-t0
+    if cpu:
+      x['cpu'] = (x['cpu'] or 0) + time.process_time()-c0
+    x['calls'] += 1
+    x['maxrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if items is not None:
+      x['items'] = (x['items'] or 0) + items()
+
+def results():
+  '''Get the records, each after its enclosing stage, with a total for
+  the whole run'''
+  index = {k:i for i,k in enumerate(records)}
+  def key(path):
+    x = path.split('/')
+    return [index.get('/'.join(x[0:i+1]), len(index)) for i in range(len(x))]
+  ret = [records[k] for k in sorted(records, key=key)]
+  if started is not None:
+    ret.append({'stage':'total', 'wall':time.perf_counter()-started[0],
+      'cpu':time.process_time()-started[1], 'items':None, 'calls':1,
+      'maxrss':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+  return ret
+
+def summary():
+  '''Tabulate the records, with nested stages indented'''
+  ret = '%-24s %9s %9s %10s %10s\n'%('stage','wall','cpu','items','maxrss(MB)')
+  for x in results():
+    depth = x['stage'].count('/')
+    ret += '%-24s %9.3f %9s %10s %10s'%('  '*depth+x['stage'].split('/').pop(), x['wall'],
+      '%.3f'%x['cpu'] if x['cpu'] is not None else '-',
+      x['items'] if x['items'] is not None else '-',
+      '%.1f'%(x['maxrss']/1024) if x['maxrss'] is not None else '-')
+    extra = ['%s=%s'%(k,v) for k,v in x.items() if k not in ('stage','wall','cpu','items','calls','maxrss')]
+    ret += ('  '+' '.join(extra) if len(extra) > 0 else '')+'\n'
+  return ret
+
+def write(path, argv):
+  '''Append the records to a file as JSON, one per line'''
+  now = datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+  with open(path,'a') as f:
+    for x in results():
+      x = dict(x, time=now, argv=argv)
+      for k in ('wall','cpu'):
+        if x[k] is not None:
+          x[k] = round(x[k],4)
+      f.write(json.dumps(x, sort_keys=True)+'\n')
+
+def finish(args, argv):
+  '''Print the summary to stderr, to keep it apart from the report, and
+  append the records to the metrics file if -profile was given one'''
+  if enabled:
+    sys.stderr.write('\n'+summary())
+    if args.profile is not True:
+      write(args.profile, argv)
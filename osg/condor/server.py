@@ -0,0 +1,141 @@
+###
+### Resident job store, refreshed from the schedd on an interval, that
+### answers condor-probe queries from other processes over a Unix socket
+###
+
+import os
+import io
+import sys
+import json
+import time
+import signal
+import socket
+import datetime
+import contextlib
+import socketserver
+
+import condor.data
+import condor.command
+
+default_path = os.getenv('HOME','.')+'/.condor-probe.sock'
+default_interval = 300
+
+# options that select jobs, which the resident store must not be limited by:
+filters = ['condor','gemc','user','site','host','exit','noexit','generator',
+  'held','idle','running','completed']
+
+class Unsupported(Exception):
+  '''Raised for queries that cannot be answered from the resident store'''
+  pass
+
+def unsupported(args, served):
+  '''Get the reason the resident store, loaded according to served, cannot
+  answer the query in args, or None if it can'''
+  if args.input or args.serve or args.refresh or args.save or args.diff:
+    return 'not a query of the resident store'
+  if args.plot is not False:
+    return 'plots are made locally'
+  if args.hold or args.vacate>=0 or args.tail is not None or args.timeline:
+    return 'actions and timelines are run by the caller, on fresh data'
+  if args.end is not None:
+    return 'the resident store ends now'
+  if args.hours > served.hours:
+    return 'the resident store covers %s hours'%served.hours
+  if args.json and not served.json:
+    return 'the resident store was not loaded with -json'
+  # log-derived metrics change what is shown and matched, e.g. exit codes,
+  # so must be loaded just as for the query, where -xrootd/exit imply -perf:
+  perf = args.perf or args.xrootd or len(args.exit) > 0
+  if perf != served.perf:
+    return 'the resident store was loaded %s -perf'%('with' if served.perf else 'without')
+  if args.cvmfs != served.cvmfs:
+    return 'the resident store was loaded %s -cvmfs'%('with' if served.cvmfs else 'without')
+  return None
+
+def refresh(args):
+  '''Reload the job store from condor_q and condor_history, where the
+  latter is incremental via the local archive, as are log-derived metrics
+  via the log cache, and generators and versions via the cluster cache'''
+  t = time.time()
+  args.end = datetime.datetime.now()
+  condor.data.reset()
+  condor.command.query(args)
+  args.refresh = False
+  print('%s:  refreshed %d jobs in %.1f seconds'%(args.end.strftime('%Y/%m/%d %H:%M:%S'),
+    len(condor.data.job_cache), time.time()-t))
+  sys.stdout.flush()
+
+class Handler(socketserver.StreamRequestHandler):
+  '''Read one JSON request, {"argv":[...]}, and write one JSON response,
+  {"status":"ok|unsupported|error", "output":...}'''
+  def handle(self):
+    try:
+      argv = json.loads(self.rfile.readline())['argv']
+    except Exception:
+      return
+    out, err = io.StringIO(), io.StringIO()
+    try:
+      with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        self.server.answer(argv, self.server.args)
+      response = {'status':'ok', 'output':out.getvalue()}
+    except Unsupported as e:
+      response = {'status':'unsupported', 'output':str(e)}
+    except (Exception, SystemExit) as e:
+      response = {'status':'error', 'output':out.getvalue()+err.getvalue()+str(e)}
+    self.wfile.write(json.dumps(response).encode('UTF-8'))
+
+def serve(args, answer):
+  '''Refresh the job store every args.interval seconds, and in between
+  answer queries at args.socket by calling answer(argv, args), which must
+  print the response or raise Unsupported'''
+  if os.path.exists(args.socket):
+    try:
+      with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(args.socket)
+      raise RuntimeError('Already serving at '+args.socket)
+    except ConnectionRefusedError:
+      os.remove(args.socket)
+  server = socketserver.UnixStreamServer(args.socket, Handler)
+  server.args = args
+  server.answer = answer
+  os.chmod(args.socket, 0o600)
+  # remove the socket on the way out:
+  signal.signal(signal.SIGTERM, lambda signum,frame: sys.exit(0))
+  try:
+    while True:
+      try:
+        refresh(args)
+      except (Exception, SystemExit) as e:
+        print('Failed to refresh:  '+str(e))
+      deadline = time.time() + args.interval
+      while time.time() < deadline:
+        server.timeout = deadline - time.time()
+        server.handle_request()
+  finally:
+    server.server_close()
+    os.remove(args.socket)
+
+def request(path, argv, timeout=600):
+  '''Get the output of a query from the resident store at a socket, or
+  None if there is none or it cannot answer the query'''
+  try:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+      s.settimeout(timeout)
+      s.connect(path)
+      s.sendall((json.dumps({'argv':argv})+'\n').encode('UTF-8'))
+      s.shutdown(socket.SHUT_WR)
+      data = []
+      while True:
+        x = s.recv(1<<16)
+        if len(x) == 0:
+          break
+        data.append(x)
+    response = json.loads(b''.join(data))
+  except (OSError, ValueError):
+    return None
+  if response['status'] == 'error':
+    sys.stderr.write(response['output']+'\n')
+    sys.exit(1)
+  if response['status'] == 'ok':
+    return response['output']
+  return None
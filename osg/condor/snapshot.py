@@ -0,0 +1,71 @@
+###
+### Binary snapshots of the munged job store, for reloading it without
+### parsing or munging:  a JSON header followed by the raw bytes of each
+### typed array, aligned such that the file can be memory-mapped
+###
+
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import time
+
+magic = b'CONDOR-SNAPSHOT\n'
+version = 1
+alignment = 8
+
+def _pad(n):
+  return n + (-n % alignment)
+
+def is_snapshot(path):
+  with open(path,'rb') as f:
+    return f.read(len(magic)) == magic
+
+def save(table, path):
+  '''Write a condor.store.JobTable to a snapshot file'''
+  meta, arrays = table.dump()
+  blobs = []
+  offset = 0
+  for name,x in arrays.items():
+    blobs.append({'name':name, 'typecode':x.typecode, 'itemsize':x.itemsize, 'offset':offset, 'length':len(x)})
+    offset += _pad(len(x)*x.itemsize)
+  header = {'version':version, 'time':int(time.time()), 'byteorder':sys.byteorder, 'arrays':blobs, 'table':meta}
+  header = json.dumps(header, separators=(',',':')).encode('UTF-8')
+  with open(path+'.tmp','wb') as f:
+    f.write(magic)
+    f.write(struct.pack('<Q', len(header)))
+    f.write(header)
+    f.write(b'\0'*(_pad(f.tell())-f.tell()))
+    for x in arrays.values():
+      f.write(x)
+      f.write(b'\0'*(_pad(f.tell())-f.tell()))
+  os.rename(path+'.tmp', path)
+
+def load(table, path):
+  '''Replace the contents of a condor.store.JobTable with a snapshot's,
+  returning the snapshot's header, e.g. its creation time'''
+  with open(path,'rb') as f:
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+      with memoryview(m) as v:
+        if v[0:len(magic)] != magic:
+          raise ValueError('Not a snapshot:  '+path)
+        start = len(magic) + 8
+        size = struct.unpack_from('<Q', v, len(magic))[0]
+        header = json.loads(bytes(v[start:start+size]))
+        if header['version'] != version:
+          raise ValueError('Unsupported snapshot version:  %s'%header['version'])
+        base = _pad(start+size)
+        arrays = {}
+        for x in header['arrays']:
+          a = array.array(x['typecode'])
+          if a.itemsize != x['itemsize']:
+            raise ValueError('Snapshot from an incompatible platform:  '+path)
+          offset = base + x['offset']
+          a.frombytes(v[offset:offset+x['length']*x['itemsize']])
+          if header['byteorder'] != sys.byteorder:
+            a.byteswap()
+          arrays[x['name']] = a
+  table.restore(header['table'], arrays)
+  return header
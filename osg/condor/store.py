@@ -0,0 +1,415 @@
+###
+### Columnar storage for HTCondor jobs:  numeric ClassAd attributes live in
+### typed arrays and repetitive strings are dictionary-encoded, with a
+### lightweight dict-like view for per-job access
+###
+
+import math
+import array
+import collections
+import collections.abc
+
+class Column():
+  '''A column of arbitrary python objects, optionally indexed by the
+  set of rows holding each stored value'''
+  postings = None
+  def __init__(self, name):
+    self.name = name
+    self.data = []
+  def __len__(self):
+    return len(self.data)
+  def encode(self, value):
+    return value
+  def decode(self, x):
+    return x
+  def index(self):
+    '''Maintain the rows holding each stored value from now on'''
+    self.postings = collections.defaultdict(set)
+    for row,x in enumerate(self.data):
+      self.postings[x].add(row)
+  def append(self, value=None):
+    x = self.encode(value)
+    self.data.append(x)
+    if self.postings is not None:
+      self.postings[x].add(len(self.data)-1)
+  def get(self, row):
+    return self.decode(self.data[row])
+  def take(self, rows):
+    '''Get the values of some rows, without any display formatting'''
+    return [self.decode(x) for x in map(self.data.__getitem__, rows)]
+  def set(self, row, value):
+    x = self.encode(value)
+    if self.postings is not None:
+      self.postings[self.data[row]].discard(row)
+      self.postings[x].add(row)
+    self.data[row] = x
+  def pop(self):
+    if self.postings is not None:
+      self.postings[self.data[-1]].discard(len(self.data)-1)
+    self.data.pop()
+  def reorder(self, rows):
+    x = self.data
+    self.data = x[0:0]
+    self.data.extend(x[i] for i in rows)
+    if self.postings is not None:
+      self.index()
+  def dump(self):
+    '''Get the column's state as JSON-able metadata and a typed array
+    (or None), for condor.snapshot'''
+    if isinstance(self.data, array.array):
+      return ({}, self.data)
+    return ({'data':self.data}, None)
+  def restore(self, meta, data):
+    '''Replace the column's state with that from dump()'''
+    self.data = meta['data'] if data is None else data
+    if self.postings is not None:
+      self.index()
+
+class IntColumn(Column):
+  '''A column of integers in a typed array, with the most negative
+  value of the type reserved for None'''
+  def __init__(self, name, typecode='i'):
+    self.name = name
+    self.data = array.array(typecode)
+    self.null = -2**(8*self.data.itemsize-1)
+  def encode(self, value):
+    try:
+      return int(value)
+    except:
+      return self.null
+  def decode(self, x):
+    return None if x == self.null else x
+
+class BoolColumn(IntColumn):
+  def __init__(self, name):
+    super().__init__(name, 'b')
+  def decode(self, x):
+    return None if x == self.null else bool(x)
+
+class FloatColumn(Column):
+  '''A column of doubles, with NaN reserved for None, optionally
+  presented to views as a formatted string'''
+  def __init__(self, name, fmt=None):
+    self.name = name
+    self.fmt = fmt
+    self.data = array.array('d')
+  def encode(self, value):
+    try:
+      return float(value)
+    except:
+      return math.nan
+  def decode(self, x):
+    if x != x:
+      return None
+    return x if self.fmt is None else self.fmt % x
+  def take(self, rows):
+    return [None if x != x else x for x in map(self.data.__getitem__, rows)]
+
+class NumberColumn(FloatColumn):
+  '''A column of doubles that remembers which values were integers,
+  presenting those unformatted, e.g. a 0 placeholder versus 0.00'''
+  def __init__(self, name, fmt=None):
+    super().__init__(name, fmt)
+    self.ints = array.array('b')
+  def append(self, value=None):
+    super().append(value)
+    self.ints.append(isinstance(value, int))
+  def set(self, row, value):
+    super().set(row, value)
+    self.ints[row] = isinstance(value, int)
+  def get(self, row):
+    x = self.data[row]
+    if x == x and self.ints[row]:
+      return int(x)
+    return self.decode(x)
+  def take(self, rows):
+    return [self.get(row) if self.ints[row] else x for row,x in zip(rows, super().take(rows))]
+  def pop(self):
+    super().pop()
+    self.ints.pop()
+  def reorder(self, rows):
+    super().reorder(rows)
+    x = self.ints
+    self.ints = array.array('b', [x[i] for i in rows])
+  def dump(self):
+    return ({'ints':[row for row,x in enumerate(self.ints) if x]}, self.data)
+  def restore(self, meta, data):
+    self.ints = array.array('b', bytes(len(data)))
+    for row in meta['ints']:
+      self.ints[row] = 1
+    super().restore(meta, data)
+
+class CodeColumn(Column):
+  '''A dictionary-encoded column of strings, where code 0 is None'''
+  def __init__(self, name):
+    self.name = name
+    self.data = array.array('i')
+    self.values = [None]
+    self.codes = {None:0}
+  def encode(self, value):
+    code = self.codes.get(value)
+    if code is None:
+      code = len(self.values)
+      self.codes[value] = code
+      self.values.append(value)
+    return code
+  def decode(self, x):
+    return self.values[x]
+  def dump(self):
+    return ({'values':self.values}, self.data)
+  def restore(self, meta, data):
+    self.values = meta['values']
+    self.codes = {v:i for i,v in enumerate(self.values)}
+    super().restore(meta, data)
+
+class VectorColumn(Column):
+  '''A column of fixed-length float vectors, stored flat, presented to
+  views as a dictionary of the labeled values plus 'list' and 'str' '''
+  def __init__(self, name, labels, fmt='%.1f'):
+    self.name = name
+    self.labels = labels
+    self.fmt = '/'.join([fmt]*len(labels))
+    self.data = array.array('d')
+  def __len__(self):
+    return len(self.data) // len(self.labels)
+  def encode(self, value):
+    if isinstance(value, dict):
+      value = value.get('list')
+    if value is None or len(value) != len(self.labels):
+      return [math.nan]*len(self.labels)
+    return [float(x) for x in value]
+  def append(self, value=None):
+    self.data.extend(self.encode(value))
+  def get(self, row):
+    n = len(self.labels)
+    x = self.data[row*n:(row+1)*n].tolist()
+    if x[0] != x[0]:
+      return None
+    ret = dict(zip(self.labels, x))
+    ret['list'] = x
+    ret['str'] = self.fmt % tuple(x)
+    return ret
+  def index(self):
+    raise TypeError('vector columns cannot be indexed')
+  def take(self, rows):
+    return [self.get(row) for row in rows]
+  def set(self, row, value):
+    n = len(self.labels)
+    self.data[row*n:(row+1)*n] = array.array('d', self.encode(value))
+  def pop(self):
+    del self.data[-len(self.labels):]
+  def reorder(self, rows):
+    n = len(self.labels)
+    x = self.data
+    self.data = array.array('d')
+    for i in rows:
+      self.data.extend(x[i*n:(i+1)*n])
+
+class JobView(collections.abc.MutableMapping):
+  '''Dict-like access to one row of a JobTable.  Null values are
+  treated as missing keys, like an absent ClassAd attribute.'''
+  __slots__ = ('table', 'row')
+  def __init__(self, table, row):
+    self.table = table
+    self.row = row
+  def __getitem__(self, key):
+    column = self.table.columns.get(key)
+    if column is not None:
+      return column.get(self.row)
+    derived = self.table.derived.get(key)
+    if derived is not None:
+      return derived(self)
+    if self.table.extras is not None:
+      return self.table.extras[self.row][key]
+    raise KeyError(key)
+  def __setitem__(self, key, value):
+    column = self.table.columns.get(key)
+    if column is not None:
+      column.set(self.row, value)
+    elif self.table.extras is not None:
+      self.table.extras[self.row][key] = value
+    else:
+      raise KeyError(key)
+  def __delitem__(self, key):
+    self[key] = None
+  def __iter__(self):
+    for key in self.table.columns:
+      if self.table.columns[key].get(self.row) is not None:
+        yield key
+    for key in self.table.derived:
+      if self.table.derived[key](self) is not None:
+        yield key
+    if self.table.extras is not None:
+      yield from self.table.extras[self.row]
+  def __len__(self):
+    return sum(1 for x in self)
+  def __contains__(self, key):
+    try:
+      return self[key] is not None
+    except KeyError:
+      return False
+  def get(self, key, default=None):
+    try:
+      x = self[key]
+    except KeyError:
+      return default
+    return default if x is None else x
+  def copy(self):
+    return self.to_dict()
+  def project(self, keys):
+    '''Copy just the given keys into a new dictionary'''
+    return {k:self.get(k) for k in keys}
+  def to_dict(self):
+    return {k:self[k] for k in self}
+
+class JobTable():
+  '''Column-oriented store of jobs, keyed by condor id.  ClassAd attributes
+  without a column are dropped, unless retain() has been called.  Each job
+  comes from a source of some rank, and a job from a higher-ranked source
+  is never replaced by one from a lower-ranked source.  The rows holding
+  each value of the columns named in indexes are maintained for select().'''
+  def __init__(self, columns, derived={}, indexes=[]):
+    self.columns = collections.OrderedDict([(c.name,c) for c in columns])
+    self.derived = derived
+    for name in indexes:
+      self.columns[name].index()
+    self.index = {}
+    self.keys = []
+    self.order = array.array('q')
+    self.counts = collections.Counter()
+    self.extras = None
+  def retain(self):
+    '''Keep all ClassAd attributes, e.g. for full JSON dumps'''
+    if self.extras is None:
+      self.extras = [{} for x in self.keys]
+  def clear(self):
+    '''Remove all jobs, keeping the columns and their indexes'''
+    for column in self.columns.values():
+      column.reorder([])
+    self.index = {}
+    self.keys = []
+    self.order = array.array('q')
+    self.counts = collections.Counter()
+    if self.extras is not None:
+      self.extras = []
+  def dump(self):
+    '''Get the table's state as JSON-able metadata and a dictionary of
+    typed arrays, for condor.snapshot'''
+    meta = {'keys':self.keys, 'counts':list(self.counts.items()), 'extras':self.extras, 'columns':{}}
+    arrays = {'order':self.order}
+    for name,column in self.columns.items():
+      meta['columns'][name],x = column.dump()
+      if x is not None:
+        arrays[name] = x
+    return meta, arrays
+  def restore(self, meta, arrays):
+    '''Replace the table's state with that from dump() of a table with
+    the same columns'''
+    if sorted(meta['columns'].keys()) != sorted(self.columns.keys()):
+      raise ValueError('The columns of the job store have changed.')
+    for name,column in self.columns.items():
+      column.restore(meta['columns'][name], arrays.get(name))
+    self.keys = meta['keys']
+    self.index = {k:i for i,k in enumerate(self.keys)}
+    self.order = arrays['order']
+    self.counts = collections.Counter(dict(meta['counts']))
+    self.extras = meta['extras']
+  def __len__(self):
+    return len(self.keys)
+  def __contains__(self, key):
+    return key in self.index
+  def __getitem__(self, key):
+    return JobView(self, self.index[key])
+  def rank(self, key):
+    '''Get the source rank of a job'''
+    return self.row_rank(self.index[key])
+  def row_rank(self, row):
+    return self.order[row] >> 32
+  def add(self, key, classad, rank=0):
+    '''Insert or replace a job from its ClassAd dictionary, returning its
+    view, or None if the job exists already from a higher-ranked source'''
+    row = self.index.get(key)
+    if row is not None and self.order[row] >> 32 > rank:
+      return None
+    order = (rank << 32) + self.counts[rank]
+    self.counts[rank] += 1
+    if row is None:
+      row = len(self.keys)
+      self.index[key] = row
+      self.keys.append(key)
+      self.order.append(order)
+      for name,column in self.columns.items():
+        column.append(classad.get(name))
+      if self.extras is not None:
+        self.extras.append({})
+    else:
+      self.order[row] = order
+      for name,column in self.columns.items():
+        column.set(row, classad.get(name))
+    if self.extras is not None:
+      self.extras[row] = {k:v for k,v in classad.items() if k not in self.columns}
+    return JobView(self, row)
+  def pop(self):
+    '''Remove the most recently added job'''
+    del self.index[self.keys.pop()]
+    self.order.pop()
+    for column in self.columns.values():
+      column.pop()
+    if self.extras is not None:
+      self.extras.pop()
+  def sort(self):
+    '''Order jobs by source rank and then arrival, e.g. after
+    concurrent insertion from multiple sources'''
+    rows = sorted(range(len(self.keys)), key=self.order.__getitem__)
+    if rows != list(range(len(rows))):
+      for column in self.columns.values():
+        column.reorder(rows)
+      self.keys = [self.keys[i] for i in rows]
+      self.index = {k:i for i,k in enumerate(self.keys)}
+      self.order = array.array('q', sorted(self.order))
+      if self.extras is not None:
+        self.extras = [self.extras[i] for i in rows]
+  def select(self, predicates, residual=None):
+    '''Get the rows, in order, whose value in each column satisfies the
+    corresponding predicate in a list of (name,predicate) pairs, and whose
+    view then satisfies an optional residual predicate.  For an indexed
+    column the predicate is called once per distinct value, and whichever
+    of the rows it accepts or rejects is smaller is kept for intersection,
+    so the cost scales with the size of the result, not of the table.'''
+    include, exclude = [], set()
+    for name,predicate in predicates:
+      column = self.columns[name]
+      if column.postings is None:
+        include.append({row for row in range(len(self.keys)) if predicate(column.get(row))})
+        continue
+      accept, reject = [], []
+      for x,rows in column.postings.items():
+        if len(rows) > 0:
+          (accept if predicate(column.decode(x)) else reject).append(rows)
+      if sum(map(len,accept)) <= sum(map(len,reject)):
+        include.append(set().union(*accept))
+      else:
+        exclude.update(*reject)
+    if len(include) > 0:
+      include.sort(key=len)
+      rows = sorted(include[0].intersection(*include[1:]).difference(exclude))
+    elif len(exclude) > 0:
+      rows = [row for row in range(len(self.keys)) if row not in exclude]
+    else:
+      rows = range(len(self.keys))
+    if residual is not None:
+      rows = [row for row in rows if residual(JobView(self, row))]
+    return rows
+  def take(self, name, rows):
+    '''Get the values in a column of some rows, without display formatting'''
+    return self.columns[name].take(rows)
+  def view(self, row):
+    return JobView(self, row)
+  def items(self):
+    for row,key in enumerate(self.keys):
+      yield (key, JobView(self, row))
+  def values(self):
+    for row in range(len(self.keys)):
+      yield JobView(self, row)
+  def to_dict(self):
+    return collections.OrderedDict([(k,v.to_dict()) for k,v in self.items()])
@@ -0,0 +1,178 @@
+###
+### Synthetic condor_q/condor_history ClassAds of a CLAS12-like pool, with
+### the job scripts and logs they point to, plus fake HTCondor commands
+### serving them, for testing and benchmarking without a schedd
+###
+
+import os
+import json
+import time
+import random
+
+# relative weights of the values of each distribution:
+sites = {'MIT':20, 'UConn':15, 'CNAF':15, 'GRIF':10, 'SGridGLA':10, 'BNL':10,
+  'Lamar':5, 'UCSD':5, 'Glasgow':5, 'NotreDame':5}
+users = {'alice':40, 'bob':25, 'carol':15, 'dave':10, 'erin':10}
+generators = {'clas12-elspectro':30, 'clasdis':25, 'lund':20, 'genKYandOnePion':10,
+  'dvcsgen':10, 'gemc':5}
+versions = {'4.4.2':60, '5.1':30, '5.4':10}
+queue_states = {1:35, 2:45, 5:20}
+exit_codes = {0:90, 202:2, 203:2, 204:3, 212:3}
+held_exit_codes = {202:20, 203:15, 204:45, 212:20}
+
+# fraction of running jobs whose logs have CVMFS errors:
+cvmfs_errors = 0.02
+
+def choose(rng, weights):
+  return rng.choices(list(weights.keys()), list(weights.values()))[0]
+
+fake_commands = {
+'condor_q':'''#!/usr/bin/env python3
+import os, sys, json
+states = {'-hold':5, '-run':2}
+states = [v for k,v in states.items() if k in sys.argv]
+print('[')
+first = True
+with open(os.path.dirname(os.path.realpath(__file__))+'/../queue.json') as f:
+  for line in f:
+    line = line.strip().rstrip(',')
+    if line in ('[',']'):
+      continue
+    if len(states) > 0 and json.loads(line)['JobStatus'] not in states:
+      continue
+    print(line if first else ','+line)
+    first = False
+print(']')
+''',
+'condor_history':'''#!/usr/bin/env python3
+import os, re, sys, json
+since = 0
+if '-since' in sys.argv:
+  since = int(re.search('<([0-9]+)', sys.argv[sys.argv.index('-since')+1]).group(1))
+print('[')
+first = True
+with open(os.path.dirname(os.path.realpath(__file__))+'/../history.json') as f:
+  for line in f:
+    line = line.strip().rstrip(',')
+    if line in ('[',']'):
+      continue
+    if 0 < json.loads(line).get('CompletionDate',0) < since:
+      break
+    print(line if first else ','+line)
+    first = False
+print(']')
+''',
+'condor_hold':'''#!/bin/sh
+for x in "$@"; do echo "Job $x held"; done
+''',
+'condor_vacate_job':'''#!/bin/sh
+for x in "$@"; do [ "$x" = "-fast" ] || echo "Job $x fast-vacated"; done
+''',
+}
+
+def write_script(path, generator, version):
+  with open(path, 'w') as f:
+    f.write('#!/bin/bash\nsource /etc/profile.d/modules.sh\n')
+    f.write('module load gemc/%s\n'%version)
+    if generator == 'lund':
+      f.write('echo LUND Event File: input.dat\n')
+    elif generator == 'gemc':
+      f.write('gemc -USE_GUI=0 clas12.gcard\n')
+    else:
+      f.write('echo Generating events with generator %s with options --trig 10000\n'%generator)
+    f.write('gemc -USE_GUI=0 -INPUT_GEN_FILE="LUND, input.dat" clas12.gcard\n')
+
+def write_logs(rng, log, start, end, now, cvmfs=False, exit=None):
+  '''Write the stdout with phase timestamps, and the stderr with an exit
+  code if one is given, of a job started at start and ended at end, or
+  still in some phase at now if end is None'''
+  with open(log[0:-4]+'.out', 'w') as f:
+    t = start
+    limit = now if end is None else end
+    for label in ('GENERATOR','GEMC','BG-MERGING','DE-NOISING','RECONSTRUCTION'):
+      if t >= limit:
+        break
+      f.write('%s START: %d\n'%(label, t))
+      f.write('...\n'*rng.randint(1,20))
+      t += rng.randint(60, 3600)
+      if t > limit and end is None:
+        break
+      t = min(t, limit)
+      f.write('%s END: %d\n'%(label, t))
+    if cvmfs:
+      f.write('CVMFS ERROR: /cvmfs/oasis.opensciencegrid.org not found\n')
+  if exit is not None:
+    with open(log[0:-4]+'.err', 'w') as f:
+      f.write('...\nexit %d\n'%exit)
+
+def generate(path, njobs, history=0.5, hours=24, cluster_size=100, logs=True, seed=1, now=None):
+  '''Write njobs jobs under path:  those in the queue to queue.json, the
+  completed fraction history of them, in the past hours, to history.json
+  (newest first), their job scripts and logs under <path>/<user>/job_<id>,
+  and fake condor_q, condor_history, condor_hold and condor_vacate_job
+  commands serving them in <path>/bin.  The JSON has one ClassAd per line.'''
+  rng = random.Random(seed)
+  now = int(now or time.time())
+  path = os.path.abspath(path)
+  os.makedirs(path+'/bin', exist_ok=True)
+  for name,text in fake_commands.items():
+    with open(path+'/bin/'+name, 'w') as f:
+      f.write(text)
+    os.chmod(path+'/bin/'+name, 0o755)
+  # queue jobs are written as they are made, completed ones once sorted:
+  f = open(path+'/queue.json', 'w')
+  nqueue, completed = 0, []
+  cluster, gemc = 4000000, 1000
+  while nqueue + len(completed) < njobs:
+    user = choose(rng, users)
+    size = min(rng.randint(1, 2*cluster_size), njobs-nqueue-len(completed))
+    directory = '%s/%s/job_%d'%(path, user, gemc)
+    os.makedirs(directory+'/log', exist_ok=True)
+    write_script(directory+'/nodeScript.sh', choose(rng, generators), choose(rng, versions))
+    qdate = now - rng.randint(3600, 3*24*3600)
+    for proc in range(size):
+      log = '%s/log/job.%d.%d.log'%(directory, cluster, proc)
+      x = {'ClusterId':cluster, 'ProcId':proc, 'QDate':qdate, 'TotalSubmitProcs':size,
+           'UserLog':log, 'Args':'%d %d'%(gemc, proc), 'Owner':'gemc',
+           'Cmd':'/group/clas12/gemc/nodeScript.sh', 'ExitBySignal':False,
+           'NumJobStarts':0, 'CumulativeSlotTime':0.0, 'RemoteUserCpu':0.0,
+           'CumulativeRemoteUserCpu':0.0, 'DiskUsage':rng.randint(1000, 2*10**6)}
+      done = rng.random() < history
+      x['JobStatus'] = 4 if done else choose(rng, queue_states)
+      if x['JobStatus'] != 1:
+        site = choose(rng, sites)
+        host = 'slot1_%d@glidein_%d@node%d.%s.edu'%(rng.randint(1,8), rng.randint(1,10**5), rng.randint(1,200), site.lower())
+        x['NumJobStarts'] = rng.choice([1,1,1,1,2,2,3])
+        x['MATCH_GLIDEIN_Site'] = site
+        x['LastRemoteHost'] = host
+        start = rng.randint(max(qdate, now-hours*3600), now-60)
+        x['JobCurrentStartDate'] = start
+        end = None
+        if done:
+          end = rng.randint(start+1, now)
+          x['CompletionDate'] = end
+          x['ExitCode'] = choose(rng, exit_codes)
+        elif x['JobStatus'] == 2:
+          x['RemoteHost'] = host
+        wall = (end or now) - start
+        x['RemoteUserCpu'] = wall * rng.uniform(0.5, 1.0)
+        x['CumulativeSlotTime'] = wall * x['NumJobStarts'] * rng.uniform(1.0, 1.2)
+        x['CumulativeRemoteUserCpu'] = x['CumulativeSlotTime'] * rng.uniform(0.5, 1.0)
+        if logs:
+          exit = choose(rng, held_exit_codes) if x['JobStatus'] == 5 else None
+          write_logs(rng, log, start, end, now, x['JobStatus'] == 2 and rng.random() < cvmfs_errors, exit)
+      if done:
+        completed.append((-end, json.dumps(x, sort_keys=True)))
+      else:
+        f.write(('[\n' if nqueue == 0 else ',\n') + json.dumps(x, sort_keys=True))
+        nqueue += 1
+    cluster += 1
+    gemc += 1
+  f.write('[\n]\n' if nqueue == 0 else '\n]\n')
+  f.close()
+  completed.sort()
+  with open(path+'/history.json', 'w') as f:
+    f.write('[\n')
+    f.write(',\n'.join([x[1] for x in completed]))
+    f.write('\n]\n')
+  return nqueue, len(completed)
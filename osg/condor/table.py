@@ -3,12 +3,49 @@
 ### 
 
 import os
+import sys
 import math
 import datetime
+import condor.pool
 import condor.util
 
 null_field = '-'
 
+class Accumulator():
+  '''Running count, sum, mean and variance of some values, in constant
+  memory, with the variance from Welford's single-pass algorithm'''
+  __slots__ = ('n','sum','mean','m2')
+  def __init__(self, values=[]):
+    self.n = 0
+    self.sum = 0
+    self.mean = 0.0
+    self.m2 = 0.0
+    for x in values:
+      self.add(x)
+  def __len__(self):
+    return self.n
+  def add(self, x):
+    self.n += 1
+    self.sum += x
+    d = x - self.mean
+    self.mean += d / self.n
+    self.m2 += d * (x - self.mean)
+  def variance(self):
+    return self.m2 / self.n
+
+class VectorAccumulator():
+  '''An Accumulator for each component of fixed-length vectors'''
+  __slots__ = ('components',)
+  def __init__(self, size, values=[]):
+    self.components = [Accumulator() for i in range(size)]
+    for x in values:
+      self.add(x)
+  def __len__(self):
+    return len(self.components[0])
+  def add(self, x):
+    for i,a in enumerate(self.components):
+      a.add(x[i])
+
 class Column():
   def __init__(self, name, width, tally=None):
     self.name = name
@@ -20,26 +57,61 @@ class Table():
   def __init__(self):
     self.columns = []
     self.rows = []
+    self.nrows = 0
     self.tallies = []
     self.width = 0
+    self.out = None
+    self.limit = None
+    self.page = None
   def add_column(self, column, tally=None):
     if not isinstance(column, Column):
       raise TypeError()
     self.columns.append(column)
-    self.tallies.append([])
+    self.tallies.append(Accumulator())
     self.fmt = ' '.join([x.fmt for x in self.columns])
     self.width = sum([x.width for x in self.columns]) + len(self.columns) - 3
+  def empty(self):
+    '''Get a new table with the same columns and no rows'''
+    ret = self.__class__()
+    for x in self.columns:
+      Table.add_column(ret, x)
+    return ret
+  def stream(self, out=sys.stdout, limit=None, page=None):
+    '''Write rows to out as they are added instead of storing them, then
+    the tallies and header in finish(), with at most limit rows and the
+    header repeated every page rows, pausing in between on a terminal'''
+    self.out = out
+    self.limit = limit
+    self.page = page
   def add_row(self, values):
-    self.rows.append(self.values_to_row(values).rstrip())
+    if self.limit is not None and self.nrows >= self.limit:
+      return
+    row = self.values_to_row(values).rstrip()
+    if self.out is None:
+      self.rows.append(row)
+    else:
+      if self.nrows == 0:
+        self.out.write(self.get_header()+'\n')
+      elif self.page and self.nrows % self.page == 0:
+        if self.out.isatty() and sys.stdin.isatty():
+          input('Press Return for more ....')
+        self.out.write(self.get_header()+'\n')
+      self.out.write(row+'\n')
+    self.nrows += 1
     self.tally(values)
+  def finish(self):
+    '''Write the tallies and trailing header of a streamed table'''
+    if self.nrows > 0:
+      self.out.write(self.get_tallies()+'\n'+self.get_header()+'\n')
+      self.out.flush()
   def tally(self, values):
     for i in range(len(values)):
       if self.columns[i].tally is not None:
         try:
           x = float(values[i])
-          self.tallies[i].append(x)
         except:
-          pass
+          continue
+        self.tallies[i].add(x)
   def values_to_row(self, values):
     # left-truncate and prefix with a '*' if a column is too long
     x = []
@@ -53,7 +125,7 @@ class Table():
     values = ['tally']
     for i in range(1,len(self.columns)):
       if self.columns[i].tally is not None and len(self.tallies[i]) > 0:
-        values.append(sum(self.tallies[i]))
+        values.append(self.tallies[i].sum)
         if self.columns[i].tally == 'avg':
           if values[-1] > 0:
             values[-1] = '%.1f' % (values[-1]/len(self.tallies[i]))
@@ -78,12 +150,13 @@ class CondorColumn(Column):
   def __init__(self, name, varname, width, tally=None):
     super().__init__(name, width, tally)
     self.varname = varname
+    self.munge = formatter(varname)
 
 class CondorTable(Table):
   def add_column(self, name, varname, width, tally=None):
     super().add_column(CondorColumn(name, varname, width, tally))
   def job_to_values(self, job):
-    return [self.munge(x.varname, job.get(x.varname)) for x in self.columns]
+    return [x.munge(job.get(x.varname)) for x in self.columns]
   def job_to_row(self, job):
     return self.values_to_row(self.job_to_values(job))
   def add_job(self, job):
@@ -94,53 +167,74 @@ class CondorTable(Table):
       self.add_job(v)
     return self
   def munge(self, name, value):
-    ret = value
+    return formatter(name)(value)
+
+dates = {}
+def format_date(value):
+  '''Format a timestamp, memoized at the displayed minute resolution'''
+  if value == '0' or value == 0:
+    return null_field
+  try:
+    minute = int(value) // 60
+  except:
+    return value
+  ret = dates.get(minute)
+  if ret is None:
+    try:
+      ret = datetime.datetime.fromtimestamp(minute*60).strftime('%m/%d %H:%M')
+    except:
+      return value
+    dates[minute] = ret
+  return ret
+
+def format_disk(value):
+  try:
+    return int(value)/1e6
+  except:
+    return value
+
+def formatter(name):
+  '''Get the function converting values of a job parameter for display'''
+  if name == 'benchmark':
+    f = lambda value: value['str']
+  elif name == 'NumJobStarts':
+    f = lambda value: null_field if value == 0 else value
+  elif name == 'ExitBySignal':
+    f = {True:'Y',False:'N'}.__getitem__
+  elif name.endswith('Date'):
+    f = format_date
+  elif name == 'DiskUsage':
+    f = format_disk
+  else:
+    f = None
+  def munge(value):
     if value is None or value == 'undefined':
-      ret = null_field
-    elif name == 'benchmark':
-      ret = value['str'] 
-    elif name == 'NumJobStarts':
-      if value == 0:
-        ret = null_field
-    elif name == 'ExitBySignal':
-      ret = {True:'Y',False:'N'}[value]
-    elif name == 'JobStatus':
-      try:
-        ret = job_states[value]
-      except:
-        pass
-    elif name.endswith('Date'):
-      if value == '0' or value == 0:
-        ret = null_field
-      else:
-        try:
-          x = datetime.datetime.fromtimestamp(int(value))
-          ret = x.strftime('%m/%d %H:%M')
-        except:
-          pass
-    elif name == 'DiskUsage':
-      try:
-        ret = int(value)/1e6
-      except:
-        pass
-    return ret
+      return null_field
+    return value if f is None else f(value)
+  return munge
 
 def average(alist, precision=2):
+  '''Format the average of a list of values or an Accumulator, or that of
+  each component of a list of lists or a VectorAccumulator'''
+  if isinstance(alist, list):
+    if len(alist) > 0 and type(alist[0]) is list:
+      alist = VectorAccumulator(len(alist[0]), alist)
+    else:
+      alist = Accumulator(alist)
   if len(alist) > 0:
-    if type(alist[0]) is list:
-      l = alist
-      x = [ average( [ l[i][j] for i in range(len(l)) ] ) for j in range(len(l[0])) ]
-      return '/'.join(x)
+    if isinstance(alist, VectorAccumulator):
+      return '/'.join([average(x) for x in alist.components])
     else:
-      return (f'%.{precision}f') % (sum(alist) / len(alist))
+      return (f'%.{precision}f') % (alist.sum / len(alist))
   else:
     return null_field
 
 def stddev(alist):
+  '''Format the standard deviation of a list of values or an Accumulator'''
+  if isinstance(alist, list):
+    alist = Accumulator(alist)
   if len(alist) > 1:
-    m = sum(alist) / len(alist)
-    s = sum([ (x-float(m))*(x-float(m)) for x in alist ])
-    return '%.2f' % math.sqrt(s / len(alist))
+    return '%.2f' % math.sqrt(alist.variance())
   else:
     return null_field
 
@@ -194,18 +288,27 @@ job_table.add_column('gen','generator',9)
 job_table.add_column('disk','DiskUsage',6)
 job_table.add_column('dt','benchmark',25)
 
-def tail_log(job, nlines):
-  print(''.ljust(80,'#'))
-  print(''.ljust(80,'#'))
-  print(job_table.get_header())
-  print(job_table.job_to_row(job))
+def format_tail(job, nlines):
+  ret = [''.ljust(80,'#'), ''.ljust(80,'#')]
+  ret.append(job_table.get_header())
+  ret.append(job_table.job_to_row(job))
   for x in (job['UserLog'],job['stdout'],job['stderr']):
     if x is not None and os.path.isfile(x):
-      print(''.ljust(80,'>'))
-      print(x)
+      ret.append(''.ljust(80,'>'))
+      ret.append(x)
       if nlines > 0:
-        print('\n'.join(reversed(list(condor.util.readlines_reverse(x, nlines)))))
+        ret.append('\n'.join(reversed(list(condor.util.readlines_reverse(x, nlines)))))
       elif nlines < 0:
-        for x in condor.util.readlines(x):
-          print(x)
+        ret.extend(condor.util.readlines(x))
+  return '\n'.join(ret)
+
+def tail_log(job, nlines):
+  print(format_tail(job, nlines))
 
+def tail_logs(jobs, nlines, threads=condor.pool.default_threads):
+  '''Print the tails of many jobs' logs, reading them in parallel'''
+  for job,tail in condor.pool.imap(lambda job: format_tail(job, nlines), jobs, threads):
+    if tail is None:
+      print('Failed to read logs for '+job.get('condorid'))
+    else:
+      print(tail)
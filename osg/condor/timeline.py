@@ -0,0 +1,161 @@
+###
+### Append-only archive of timeline entries, stored as monthly JSON Lines
+### segments that are shipped incrementally and compressed once complete,
+### plus rollups of them at several resolutions for the web pages
+###
+
+import os
+import bisect
+import glob
+import gzip
+import json
+import datetime
+import subprocess
+
+default_path = os.getenv('HOME','.')+'/timeline'
+default_dest = 'dtn1902:/volatile/clas12/osg/timeline'
+
+# the single-file archive this replaces, migrated on first use:
+legacy_path = os.getenv('HOME','.')+'/timeline.json'
+
+# rollups as (name, bucket width, retention) in seconds, with zero width
+# meaning the raw entries and no retention meaning forever:
+rollups = [('raw', 0, 3*24*60*60), ('hourly', 60*60, 6*7*24*60*60), ('daily', 24*60*60, None)]
+
+def _add_point(series, ts, value):
+  '''Add a value to the [ts, min, mean, max, n] point for its bucket,
+  returning whether that is a new point'''
+  if len(series) == 0 or series[-1][0] < ts:
+    series.append([ts, value, value, value, 1])
+    return True
+  # entries arrive in order, so this is nearly always the last bucket:
+  if series[-1][0] == ts:
+    i = len(series)-1
+  else:
+    i = bisect.bisect_left([x[0] for x in series], ts)
+  if series[i][0] != ts:
+    series.insert(i, [ts, value, value, value, 1])
+    return True
+  else:
+    x = series[i]
+    x[4] += 1
+    x[1] = min(x[1], value)
+    x[2] += (value - x[2]) / x[4]
+    x[3] = max(x[3], value)
+    return False
+
+def _trim(series, cutoff):
+  '''Remove the points before a cutoff from the front of a series'''
+  i = 0
+  while i < len(series) and series[i][0] < cutoff:
+    i += 1
+  if i > 0:
+    del series[0:i]
+
+class Timeline():
+  '''Timeline entries, appended to the segment for their month, where
+  segments for previous months get compacted into gzipped ones'''
+  def __init__(self, path=default_path):
+    self.path = path
+    os.makedirs(path, exist_ok=True)
+  def segment(self, ts):
+    '''Get the path of the (uncompressed) segment for a timestamp'''
+    return '%s/%s.jsonl' % (self.path, datetime.datetime.fromtimestamp(ts).strftime('%Y-%m'))
+  def segments(self):
+    '''Get the names of all segments, in chronological order'''
+    x = glob.glob(self.path+'/*.jsonl') + glob.glob(self.path+'/*.jsonl.gz')
+    return sorted([os.path.basename(p) for p in x])
+  def append(self, entry):
+    '''Add one entry, at the cost of writing just that entry'''
+    with open(self.segment(entry['update_ts']), 'a') as f:
+      f.write(json.dumps(entry, sort_keys=True, separators=(',',':'))+'\n')
+  def read(self):
+    '''Yield all entries, in order'''
+    for name in self.segments():
+      path = self.path+'/'+name
+      with (gzip.open(path,'rt') if name.endswith('.gz') else open(path,'r')) as f:
+        for line in f:
+          if len(line.strip()) > 0:
+            yield json.loads(line)
+  def migrate(self, legacy=legacy_path):
+    '''Split a legacy, single-file JSON archive into segments, if there
+    are none yet, returning the number of entries migrated'''
+    if len(self.segments()) > 0 or not os.path.exists(legacy):
+      return 0
+    with open(legacy,'r') as f:
+      entries = sorted(json.load(f), key=lambda x: x['update_ts'])
+    for entry in entries:
+      self.append(entry)
+    return len(entries)
+  def compact(self, now=None):
+    '''Compress the segments of months before the current one, which will
+    never be appended to again, returning their names'''
+    current = os.path.basename(self.segment(now or int(datetime.datetime.now().timestamp())))
+    ret = []
+    for name in self.segments():
+      if name.endswith('.jsonl') and name < current:
+        path = self.path+'/'+name
+        with open(path,'rb') as fin:
+          with gzip.open(path+'.gz.tmp','wb') as fout:
+            fout.write(fin.read())
+        os.rename(path+'.gz.tmp', path+'.gz')
+        os.remove(path)
+        ret.append(name)
+    return ret
+  def add_rollup(self, data, entry):
+    '''Add one entry to a rollup, in place, trimming expired points'''
+    ts = entry['update_ts']
+    if data['resolution'] > 0:
+      ts -= ts % data['resolution']
+    new = False
+    for group in ('global','sites'):
+      for k,v in entry.get(group,{}).items():
+        if v is not None:
+          new = _add_point(data[group].setdefault(k,[]), ts, v) or new
+    # points only expire once time moves into a new bucket:
+    if data['retention'] is not None and new:
+      cutoff = entry['update_ts'] - data['retention']
+      for group in ('global','sites'):
+        for k in list(data[group].keys()):
+          _trim(data[group][k], cutoff)
+          if len(data[group][k]) == 0:
+            data[group].pop(k)
+  def update_rollups(self, entry):
+    '''Add an entry to each rollup file, e.g. hourly.json, each of which
+    has min/mean/max/n series for the global counts and each site, or
+    rebuild them all from the archive if any is missing'''
+    paths = ['%s/%s.json'%(self.path,name) for name,width,retention in rollups]
+    if not all([os.path.exists(x) for x in paths]):
+      self.rebuild_rollups()
+      return
+    for path in paths:
+      with open(path,'r') as f:
+        data = json.load(f)
+      self.add_rollup(data, entry)
+      self.write(path, data)
+  def rebuild_rollups(self):
+    '''Regenerate all the rollup files from the archive'''
+    data = [{'resolution':width, 'retention':retention, 'global':{}, 'sites':{}}
+      for name,width,retention in rollups]
+    for entry in self.read():
+      for x in data:
+        self.add_rollup(x, entry)
+    for (name,width,retention),x in zip(rollups,data):
+      self.write('%s/%s.json'%(self.path,name), x)
+  def write(self, path, data):
+    with open(path+'.tmp','w') as f:
+      f.write(json.dumps(data, separators=(',',':')))
+    os.rename(path+'.tmp', path)
+  def write_index(self):
+    '''List the segments in index.json, for the web pages to load them'''
+    self.write(self.path+'/index.json', self.segments())
+  def ship(self, dest=default_dest):
+    '''Copy the archive to the web host, transferring only what was
+    appended to segments since the last time, plus new segments and the
+    (small) rollups'''
+    for x in glob.glob(self.path+'/*'):
+      os.chmod(x, 0o644)
+    subprocess.check_output(['rsync','-a','--append-verify','--delete',
+      '--include','*.jsonl','--include','*.jsonl.gz','--exclude','*',self.path+'/',dest+'/'])
+    x = ['%s/%s.json'%(self.path,name) for name,width,retention in rollups]
+    subprocess.check_output(['rsync','-a',self.path+'/index.json']+x+[dest+'/'])
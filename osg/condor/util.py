@@ -4,6 +4,7 @@
 
 import os
 import gzip
+import json
 import collections
 
 def sort_dict(dictionary, subkey):
@@ -31,37 +32,102 @@ def readlines(filename):
   if filename is not None:
     if os.path.isfile(filename):
       if filename.endswith('.gz'):
-        f = gzip.open(filename, errors='replace')
+        f = gzip.open(filename, 'rt', errors='replace')
       else:
         f = open(filename, errors='replace')
-      for line in f.readlines():
-        yield line.strip()
-      f.close()
+      with f:
+        for line in f:
+          yield line.strip()
 
-def readlines_reverse(filename, max_lines):
-  '''Get the trailing lines from a file, stopping
-  after max_lines unless max_lines is negative'''
+def readlines_reverse(filename, max_lines, block_size=65536):
+  '''Get the trailing lines from a file, last first, stopping
+  after max_lines unless max_lines is not positive'''
   if filename is not None:
     if os.path.isfile(filename):
       if filename.endswith('.gz'):
-        f = gzip.open(filename, errors='replace')
-      else:
-        f = open(filename, errors='replace')
-      n_lines = 0
-      f.seek(0, os.SEEK_END)
-      position = f.tell()
-      line = ''
-      while position >= 0:
-        if n_lines > max_lines and max_lines>0:
-          break
-        f.seek(position)
-        next_char = f.read(1)
-        if next_char == "\n":
-           n_lines += 1
-           yield line[::-1]
-           line = ''
-        else:
-           line += next_char
-        position -= 1
-      yield line[::-1]
+        # seeking backwards in gzip means decompressing from the start
+        # each time, so instead decompress forward once into a ring buffer:
+        with gzip.open(filename, 'rt', errors='replace') as f:
+          lines = collections.deque(f, max_lines if max_lines > 0 else None)
+        while len(lines) > 0:
+          yield lines.pop().rstrip('\n')
+        return
+      with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = None
+        n_lines = 0
+        while position > 0:
+          size = min(block_size, position)
+          position -= size
+          f.seek(position)
+          block = f.read(size)
+          if remainder is None:
+            # ignore the empty "line" after a trailing newline:
+            remainder = block[:-1] if block.endswith(b'\n') else block
+          else:
+            remainder = block + remainder
+          lines = remainder.split(b'\n')
+          # the first line may continue into the previous block:
+          remainder = lines.pop(0)
+          for line in reversed(lines):
+            yield line.decode('UTF-8', errors='replace')
+            n_lines += 1
+            if n_lines == max_lines:
+              return
+        if remainder is not None:
+          yield remainder.decode('UTF-8', errors='replace')
 
+def read_json(stream, chunk_size=65536):
+  '''Incrementally parse the elements of a JSON list, or the values of a
+  JSON dictionary, from a text stream, yielding one element at a time'''
+  decoder = json.JSONDecoder()
+  buf = ''
+  pos = 0
+  eof = False
+  top = None
+  while True:
+    while pos < len(buf) and buf[pos].isspace():
+      pos += 1
+    if pos < len(buf) and top is not None and buf[pos] == ',':
+      pos += 1
+      continue
+    if pos < len(buf) and top is None:
+      if buf[pos] not in '[{':
+        raise ValueError('Expected a JSON list or dictionary')
+      top = buf[pos]
+      pos += 1
+      continue
+    if pos < len(buf) and buf[pos] in ']}':
+      return
+    try:
+      if pos >= len(buf):
+        raise ValueError()
+      end = pos
+      if top == '{':
+        key,end = decoder.raw_decode(buf, end)
+        while end < len(buf) and buf[end].isspace():
+          end += 1
+        if end >= len(buf) or buf[end] != ':':
+          raise ValueError()
+        end += 1
+        while end < len(buf) and buf[end].isspace():
+          end += 1
+      value,end = decoder.raw_decode(buf, end)
+      # a number may continue in the next chunk, e.g. 3 of 3.5:
+      if not eof and (end >= len(buf) or buf[end] not in ' \t\r\n,]}'):
+        raise ValueError()
+    except ValueError:
+      # incomplete element, need more data:
+      if eof:
+        if top is None and len(buf[pos:].strip()) == 0:
+          return
+        raise ValueError('Truncated JSON input')
+      data = stream.read(chunk_size)
+      if len(data) == 0:
+        eof = True
+      buf = buf[pos:] + data
+      pos = 0
+      continue
+    pos = end
+    yield value
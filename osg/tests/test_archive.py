@@ -0,0 +1,133 @@
+import time
+
+import condor.archive
+
+attributes = ['ClusterId','ProcId','CompletionDate','JobStatus','EnteredCurrentStatus']
+hour = 60*60
+
+class History():
+  '''A fake condor_history:  ads in the order they were written to the
+  history file, scanned newest first until the first one completed
+  before -since, like CompletionDate!=0&&CompletionDate<since'''
+  def __init__(self):
+    self.ads = []
+    self.fetches = []
+  def append(self, cluster, proc, completion, status=4, entered=None):
+    x = {'ClusterId':cluster, 'ProcId':proc, 'JobStatus':status, 'CompletionDate':completion}
+    if entered is not None:
+      x['EnteredCurrentStatus'] = entered
+    self.ads.append(x)
+  def fetch(self, since):
+    self.fetches.append(since)
+    for x in reversed(self.ads):
+      if 0 < x['CompletionDate'] < since:
+        break
+      yield dict(x)
+
+def ids(archive, start, end, clusters=[]):
+  return ['%d.%d'%(x['ClusterId'],x['ProcId']) for x in archive.select(start, end, clusters)]
+
+def test_first_sync_and_select(tmp_path):
+  now = int(time.time())
+  h = History()
+  # out of order CompletionDates, as jobs leave the queue late:
+  for i,dt in enumerate([50, 40, 45, 30, 20, 25, 10, 5, 5]):
+    h.append(1, i, now-dt*hour)
+  archive = condor.archive.HistoryArchive(str(tmp_path/'h.db'), attributes)
+  archive.sync(h.fetch, now-24*hour)
+  assert h.fetches == [now-24*hour]
+  assert archive.low_water() == now-24*hour
+  assert archive.high_water() == now-5*hour
+  # newest first, ties in the order fetched, i.e. condor_history's, and
+  # like condor_history stopping at 1.5, which was written after 1.4:
+  assert ids(archive, now-24*hour, now) == ['1.8','1.7','1.6']
+  assert ids(archive, now-22*hour, now-6*hour) == ['1.6']
+  assert ids(archive, now-24*hour, now, [2]) == []
+
+def test_incremental_sync_catches_late_jobs(tmp_path):
+  now = int(time.time())
+  h = History()
+  h.append(1, 0, now-10*hour)
+  h.append(1, 1, now-3*hour)
+  archive = condor.archive.HistoryArchive(str(tmp_path/'h.db'), attributes)
+  archive.sync(h.fetch, now-24*hour)
+  # written later, but completed before the newest archived job, e.g.
+  # after lingering in the queue, followed by a newer one:
+  h.append(2, 0, now-4*hour)
+  h.append(2, 1, now-2*hour)
+  h.append(3, 0, now-1*hour)
+  archive.sync(h.fetch, now-24*hour)
+  assert h.fetches[-1] == now-3*hour-condor.archive.overlap
+  assert ids(archive, now-24*hour, now) == ['3.0','2.1','1.1','2.0','1.0']
+  assert archive.low_water() == now-24*hour
+  assert archive.high_water() == now-1*hour
+
+def test_removed_jobs(tmp_path):
+  now = int(time.time())
+  h = History()
+  h.append(1, 0, now-10*hour)
+  h.append(1, 1, 0, status=3, entered=now-5*hour)
+  h.append(1, 2, 0, status=3)
+  h.append(1, 3, now-2*hour)
+  archive = condor.archive.HistoryArchive(str(tmp_path/'h.db'), attributes)
+  archive.sync(h.fetch, now-24*hour)
+  # stored by removal time, and not moving the high-water mark:
+  assert ids(archive, now-24*hour, now) == ['1.3','1.1','1.0']
+  assert archive.high_water() == now-2*hour
+  ad = list(archive.select(now-6*hour, now-4*hour))[0]
+  assert ad['JobStatus'] == 3 and 'EnteredCurrentStatus' in ad
+
+def test_backfill(tmp_path):
+  now = int(time.time())
+  h = History()
+  for i in range(48):
+    h.append(1, i, now-(48-i)*hour)
+  archive = condor.archive.HistoryArchive(str(tmp_path/'h.db'), attributes)
+  archive.sync(h.fetch, now-12*hour)
+  assert len(ids(archive, 0, now)) == 12
+  # a query further back than the archive covers refetches from there:
+  archive.sync(h.fetch, now-36*hour)
+  assert h.fetches[-1] == now-36*hour
+  assert archive.low_water() == now-36*hour
+  assert archive.high_water() == now-1*hour
+  assert len(ids(archive, now-36*hour, now)) == 36
+  # while one within it just updates incrementally:
+  archive.sync(h.fetch, now-24*hour)
+  assert h.fetches[-1] == now-1*hour-condor.archive.overlap
+  assert archive.low_water() == now-36*hour
+
+def test_refresh(tmp_path):
+  now = int(time.time())
+  h = History()
+  h.append(1, 0, now-2*hour)
+  path = str(tmp_path/'h.db')
+  archive = condor.archive.HistoryArchive(path, attributes)
+  archive.sync(h.fetch, now-24*hour)
+  # e.g. after the schedd's history was rotated away:
+  h.ads = [{'ClusterId':2, 'ProcId':0, 'JobStatus':4, 'CompletionDate':now-hour}]
+  archive.sync(h.fetch, now-6*hour, refresh=True)
+  assert h.fetches[-1] == now-6*hour
+  assert ids(archive, 0, now) == ['2.0']
+  assert archive.low_water() == now-6*hour
+  archive.close()
+  # and changing the attributes discards everything:
+  archive = condor.archive.HistoryArchive(path, attributes+['ExitCode'])
+  assert ids(archive, 0, now) == []
+  assert archive.low_water() is None
+
+def test_retention(tmp_path):
+  now = int(time.time())
+  days = condor.archive.retention_days
+  h = History()
+  h.append(1, 0, now-(days+2)*24*hour)
+  h.append(1, 1, now-(days-2)*24*hour)
+  h.append(1, 2, now-hour)
+  archive = condor.archive.HistoryArchive(str(tmp_path/'h.db'), attributes)
+  # a query reaching back further than the retention is still served:
+  archive.sync(h.fetch, now-(days+3)*24*hour)
+  assert ids(archive, 0, now) == ['1.2','1.1','1.0']
+  assert archive.low_water() == now-(days+3)*24*hour
+  # but the next sync prunes it, and the coverage with it:
+  archive.sync(h.fetch, now-24*hour)
+  assert archive.low_water() >= now-days*24*hour-1
+  assert ids(archive, 0, now) == ['1.2','1.1']
@@ -0,0 +1,132 @@
+import os
+import threading
+
+import condor.logcache
+import condor.clustercache
+
+def write(path, text, mtime=None):
+  with open(path, 'w') as f:
+    f.write(text)
+  if mtime is not None:
+    os.utime(path, (mtime, mtime))
+
+def run_threads(n, func):
+  errors = []
+  def run(i):
+    try:
+      func(i)
+    except Exception as e:
+      errors.append(e)
+  threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  assert errors == []
+
+def test_logcache_threads(tmp_path):
+  paths = [str(tmp_path/('job.%d.out'%i)) for i in range(50)]
+  for i,path in enumerate(paths):
+    write(path, 'x'*i)
+  paths.append(str(tmp_path/'missing.out'))
+  size = lambda path: os.path.getsize(path) if os.path.exists(path) else None
+  cache = condor.logcache.LogCache(str(tmp_path/'logs.db'))
+  cached = {}
+  # every thread looks up every log, for two metrics, so each is
+  # computed by at least one thread and the rest are hits or misses:
+  def lookup(i):
+    for path in paths[i%7:]+paths[:i%7]:
+      assert cache.get(cached, path, 'size', size, path) == size(path)
+      assert cache.get(cached, path, 'name', os.path.basename, path) == os.path.basename(path)
+  run_threads(8, lookup)
+  assert cache.counts['hits'] + cache.counts['misses'] == 8*2*(len(paths)-1)
+  assert cache.counts['misses'] >= 2*(len(paths)-1)
+  cache.save()
+  assert cache.counts['evictions'] == 0
+  cache.close()
+  # all from the database now, including both metrics of each log:
+  cache = condor.logcache.LogCache(str(tmp_path/'logs.db'))
+  cached.update(cache.lookup(paths))
+  assert sorted(cached.keys()) == sorted(paths[:-1])
+  assert all(sorted(x[2].keys()) == ['name','size'] for x in cached.values())
+  run_threads(8, lookup)
+  assert cache.counts == {'hits':8*2*(len(paths)-1), 'misses':0, 'evictions':0}
+  cache.close()
+
+def test_logcache_stale_entries(tmp_path):
+  path = str(tmp_path/'job.out')
+  write(path, 'first', 1000000000)
+  calls = []
+  def read(path):
+    calls.append(path)
+    with open(path) as f:
+      return f.read()
+  db = str(tmp_path/'logs.db')
+  cache = condor.logcache.LogCache(db)
+  assert cache.get(cache.lookup([path]), path, 'text', read, path) == 'first'
+  cache.save()
+  assert cache.get(cache.lookup([path]), path, 'text', read, path) == 'first'
+  assert len(calls) == 1
+  # a different size:
+  write(path, 'second', 1000000000)
+  assert cache.get(cache.lookup([path]), path, 'text', read, path) == 'second'
+  cache.save()
+  # the same size, but a different mtime:
+  write(path, 'thirds', 1000000001)
+  assert cache.get(cache.lookup([path]), path, 'text', read, path) == 'thirds'
+  cache.save()
+  assert len(calls) == 3
+  assert cache.counts == {'hits':1, 'misses':3, 'evictions':0}
+  # gone, e.g. transferred, so evicted:
+  os.remove(path)
+  assert cache.get(cache.lookup([path]), path, 'text', lambda x: None, path) is None
+  cache.save()
+  assert cache.counts['evictions'] == 1
+  assert cache.lookup([path]) == {}
+  # and the cumulative counts persist:
+  assert dict(cache.db.execute('SELECT key,value FROM meta').fetchall()) == {'hits':1, 'misses':3, 'evictions':1}
+  cache.close()
+
+def test_clustercache_threads(tmp_path):
+  scripts = {}
+  for cluster in range(20):
+    scripts[cluster] = str(tmp_path/('nodeScript.%d.sh'%cluster))
+    write(scripts[cluster], 'generator %d'%cluster)
+  parse = lambda path: {'generator':open(path).read()}
+  db = str(tmp_path/'clusters.db')
+  cache = condor.clustercache.ClusterCache(db)
+  def lookup(i):
+    for cluster,script in scripts.items():
+      assert cache.get(cluster, script, parse) == {'generator':'generator %d'%cluster}
+  run_threads(8, lookup)
+  assert cache.counts['hits'] + cache.counts['misses'] == 8*len(scripts)
+  cache.save()
+  cache.close()
+  cache = condor.clustercache.ClusterCache(db)
+  run_threads(8, lookup)
+  assert cache.counts == {'hits':8*len(scripts), 'misses':0, 'evictions':0}
+  cache.close()
+
+def test_clustercache_stale_entries(tmp_path):
+  script = str(tmp_path/'nodeScript.sh')
+  write(script, 'lund', 1000000000)
+  calls = []
+  def parse(path):
+    calls.append(path)
+    return {'generator':open(path).read()}
+  db = str(tmp_path/'clusters.db')
+  cache = condor.clustercache.ClusterCache(db)
+  assert cache.get(1, script, parse) == {'generator':'lund'}
+  cache.save()
+  assert cache.get(1, script, parse) == {'generator':'lund'}
+  assert len(calls) == 1
+  write(script, 'gemc', 1000000001)
+  assert cache.get(1, script, parse) == {'generator':'gemc'}
+  cache.save()
+  assert len(calls) == 2
+  os.remove(script)
+  assert cache.get(1, script, lambda path: {'generator':None}) == {'generator':None}
+  cache.save()
+  assert cache.counts == {'hits':1, 'misses':2, 'evictions':1}
+  assert cache.db.execute('SELECT COUNT(*) FROM clusters').fetchone()[0] == 0
+  cache.close()
@@ -0,0 +1,209 @@
+import re
+import json
+import datetime
+
+import pytest
+
+import condor.data
+import condor.probe
+import condor.command
+import condor.matching
+import condor.synthetic
+from condor.cli import cli
+
+###
+### A small evaluator for the subset of the ClassAd language that
+### CondorMatchers.constraint() produces, standing in for the schedd
+###
+
+undefined = object()
+
+tokens = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|(-?[0-9]+)|([A-Za-z_][A-Za-z0-9_]*)|(=\?=|=!=|==|!=|<=|>=|&&|\|\||[!()<>,]))')
+
+def tokenize(text):
+  ret = []
+  pos = 0
+  text = text.rstrip()
+  while pos < len(text):
+    m = tokens.match(text, pos)
+    assert m is not None, 'cannot tokenize:  '+text[pos:]
+    s,n,name,op = m.groups()
+    if s is not None:
+      ret.append(('value', re.sub(r'\\(.)', r'\1', s[1:-1])))
+    elif n is not None:
+      ret.append(('value', int(n)))
+    elif name is not None:
+      ret.append(('value', undefined) if name == 'undefined' else ('name', name))
+    else:
+      ret.append(('op', op))
+    pos = m.end()
+  return ret
+
+def evaluate(text, ad):
+  '''Evaluate a constraint, or its tokens, against a ClassAd dictionary,
+  returning True, False or undefined'''
+  toks = tokenize(text) if isinstance(text, str) else text
+  pos = [0]
+  def peek():
+    return toks[pos[0]] if pos[0] < len(toks) else (None, None)
+  def take(op=None):
+    x = toks[pos[0]]
+    assert op is None or x == ('op', op), (x, op)
+    pos[0] += 1
+    return x
+  def binary(sub, ops, func):
+    def parse():
+      x = sub()
+      while peek()[0] == 'op' and peek()[1] in ops:
+        op = take()[1]
+        x = func(op, x, sub())
+      return x
+    return parse
+  def logical(op, a, b):
+    if op == '||':
+      if a is True or b is True:
+        return True
+      return undefined if undefined in (a, b) else False
+    if a is False or b is False:
+      return False
+    return undefined if undefined in (a, b) else True
+  def compare(op, a, b):
+    if op == '=?=':
+      return a is b if undefined in (a, b) else a == b
+    if op == '=!=':
+      return a is not b if undefined in (a, b) else a != b
+    if undefined in (a, b):
+      return undefined
+    return {'==':a == b, '!=':a != b, '<=':a <= b, '>=':a >= b, '<':a < b, '>':a > b}[op]
+  def unary():
+    if peek() == ('op', '!'):
+      take()
+      x = unary()
+      return undefined if x is undefined else not x
+    return primary()
+  def primary():
+    kind,x = take()
+    if kind == 'value':
+      return x
+    if kind == 'op':
+      assert x == '('
+      ret = disjunction()
+      take(')')
+      return ret
+    if peek() == ('op', '('):
+      take('(')
+      params = [disjunction()]
+      while peek() == ('op', ','):
+        take()
+        params.append(disjunction())
+      take(')')
+      if x == 'isUndefined':
+        return params[0] is undefined
+      if x == 'regexp':
+        if undefined in params:
+          return undefined
+        return re.search(params[0], str(params[1])) is not None
+      raise ValueError('unknown function '+x)
+    v = ad.get(x)
+    return undefined if v is None else v
+  comparison = binary(unary, ('==','!=','<=','>=','<','>','=?=','=!='), compare)
+  conjunction = binary(comparison, ('&&',), logical)
+  disjunction = binary(conjunction, ('||',), logical)
+  ret = disjunction()
+  assert pos[0] == len(toks)
+  return ret
+
+def test_evaluate():
+  ad = {'A':1, 'S':'MIT', 'L':'/x/job\\.1'}
+  assert evaluate('A == 1 && (B =?= undefined || B == 2)', ad) is True
+  assert evaluate('B == 2', ad) is undefined
+  assert evaluate('!(B == 2) || A =!= 1', ad) is undefined
+  assert evaluate('isUndefined(B) && regexp(S, "xMITx") && !regexp("y", S)', ad) is True
+  assert evaluate('regexp("job\\\\.1", L)', {'L':'/x/job.1'}) is True
+  assert evaluate('regexp("job\\\\.1", L)', {'L':'/x/jobx1'}) is False
+
+###
+### The synthetic pool, and the jobs accepted each way for some options
+###
+
+@pytest.fixture(scope='module')
+def pool(tmp_path_factory):
+  path = str(tmp_path_factory.mktemp('pool'))
+  now = int(datetime.datetime.now().timestamp())
+  condor.synthetic.generate(path, 1000, history=0.5, hours=24, cluster_size=30, now=now)
+  ads = {}
+  for name,rank in (('queue',condor.command.queue_rank), ('history',condor.command.history_rank)):
+    with open('%s/%s.json'%(path,name)) as f:
+      ads[rank] = json.load(f)
+  return ads
+
+end = (datetime.datetime.now()-datetime.timedelta(hours=6)).strftime('%Y/%m/%d_%H:%M:%S')
+
+# options, and whether the constraint is exact, i.e. not just a superset:
+cases = [
+  ([], True),
+  (['-user','alice'], True),
+  (['-user','alice','-user','bob'], True),
+  (['-user=-alice'], True),
+  (['-gemc','1001'], True),
+  (['-gemc=-1001','-gemc=-1002'], True),
+  (['-condor','4000001'], True),
+  (['-condor','4000001','-condor','4000003'], True),
+  (['-condor=-4000001'], True),
+  (['-site','MIT'], True),
+  (['-site','MIT','-site','UConn'], True),
+  (['-site=-MIT'], True),
+  # -exit implies -perf, for which held jobs' exit codes come from logs:
+  (['-exit','204'], False),
+  (['-exit','0','-exit','212'], False),
+  (['-noexit'], True),
+  (['-held'], True),
+  (['-idle'], True),
+  (['-running'], True),
+  (['-completed'], True),
+  (['-end',end], True),
+  (['-user','alice','-site','UConn','-running'], True),
+  (['-generator','lund'], False),
+  (['-generator=-lund'], False),
+  (['-host','node1'], False),
+  (['-host=-node1'], False),
+  (['-held','-exit','204','-perf'], False),
+  (['-exit','212','-perf'], False),
+]
+
+def load(ads, opts):
+  args = cli.parse_args(['-hours','24','-logcache','','-clustercache','']+opts)
+  condor.probe.check(args)
+  everything = cli.parse_args(['-hours','24','-logcache','','-clustercache','','-end',args.end.strftime('%Y/%m/%d_%H:%M:%S')])
+  condor.probe.check(everything)
+  condor.data.reset()
+  for rank,x in ads.items():
+    condor.data.add_classads([dict(ad) for ad in x], everything, rank)
+  condor.data.job_cache.sort()
+  condor.data.analyze_logs(args)
+  # compare the matchers alone, not the selection by source:
+  args.input = 'synthetic'
+  return args
+
+@pytest.mark.parametrize('opts,exact', cases)
+def test_select_constraint_and_matches_agree(pool, opts, exact):
+  args = load(pool, opts)
+  cm = condor.matching.CondorMatchers(args)
+  table = condor.data.job_cache
+  selected = [table.keys[row] for row in cm.select(table)]
+  matched = [cid for cid,job in table.items() if cm.matches(job)]
+  assert selected == matched
+  matched = set(matched)
+  constraint = tokenize(cm.constraint())
+  log_constraint = tokenize(cm.log_constraint())
+  for rank,ads in pool.items():
+    for ad in ads:
+      cid = '%d.%d'%(ad['ClusterId'],ad['ProcId'])
+      accepted = evaluate(constraint, ad) is True
+      if cid in matched:
+        assert accepted, cid
+        assert evaluate(log_constraint, ad) is True, cid
+      elif exact:
+        assert not accepted, cid
+  if len(opts) > 0 and not exact:
+    assert len(matched) < len(table)
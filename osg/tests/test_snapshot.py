@@ -0,0 +1,133 @@
+import json
+import random
+
+import pytest
+
+import condor.data
+import condor.probe
+import condor.snapshot
+import condor.synthetic
+
+from test_store import new_table, fill, check_indexes, classad
+
+def test_table_round_trip(tmp_path):
+  rng = random.Random(1)
+  table = new_table()
+  fill(rng, table)
+  table.add('9.0', {'ClusterId':9})
+  table.add('9.1', {'ClusterId':9, 'ceff':0, 'benchmark':[0.5, 1.5]})
+  table.sort()
+  path = str(tmp_path/'jobs.snapshot')
+  condor.snapshot.save(table, path)
+  assert condor.snapshot.is_snapshot(path)
+  loaded = new_table()
+  header = condor.snapshot.load(loaded, path)
+  assert header['version'] == condor.snapshot.version
+  check_indexes(loaded)
+  assert loaded.keys == table.keys
+  assert list(loaded.order) == list(table.order)
+  assert loaded.counts == table.counts
+  for key in table.keys:
+    assert loaded[key].to_dict() == table[key].to_dict()
+    assert loaded.rank(key) == table.rank(key)
+  rows = list(range(len(table)))
+  for name in table.columns:
+    assert loaded.take(name, rows) == table.take(name, rows)
+  assert loaded['9.0'].to_dict() == {'ClusterId':9}
+  assert loaded['9.1']['ceff'] == 0
+  # and it keeps working as a table:
+  predicates = [('site', lambda x: x == 'MIT')]
+  assert list(loaded.select(predicates)) == list(table.select(predicates))
+  loaded.add('10.0', classad(rng, 10))
+  loaded.pop()
+  check_indexes(loaded)
+
+def test_retained_attributes_round_trip(tmp_path):
+  table = new_table()
+  table.retain()
+  table.add('1.0', {'ClusterId':1, 'Owner':'gemc', 'Nested':{'a':[1,2]}})
+  path = str(tmp_path/'jobs.snapshot')
+  condor.snapshot.save(table, path)
+  loaded = new_table()
+  condor.snapshot.load(loaded, path)
+  assert loaded['1.0'].to_dict() == {'ClusterId':1, 'Owner':'gemc', 'Nested':{'a':[1,2]}}
+
+def test_not_a_snapshot(tmp_path):
+  path = str(tmp_path/'jobs.json')
+  with open(path, 'w') as f:
+    f.write('[]')
+  assert not condor.snapshot.is_snapshot(path)
+  with pytest.raises(ValueError):
+    condor.snapshot.load(new_table(), path)
+
+def test_changed_columns(tmp_path):
+  path = str(tmp_path/'jobs.snapshot')
+  condor.snapshot.save(new_table(), path)
+  with pytest.raises(ValueError):
+    condor.snapshot.load(condor.data.new_job_table(), path)
+
+###
+### -save and -input or -diff via condor-probe, on a synthetic pool
+###
+
+options = ['-socket','','-logcache','','-clustercache','','-archive','']
+
+@pytest.fixture(scope='module')
+def pool(tmp_path_factory):
+  path = tmp_path_factory.mktemp('pool')
+  condor.synthetic.generate(str(path), 500, cluster_size=20, logs=False)
+  ads = []
+  for name in ('queue','history'):
+    with open(str(path/(name+'.json'))) as f:
+      ads.extend(json.load(f))
+  return path, ads
+
+def write_json(path, ads):
+  with open(str(path), 'w') as f:
+    json.dump(ads, f)
+  return str(path)
+
+def probe(capsys, argv):
+  condor.data.reset()
+  condor.probe.main(argv+options)
+  return capsys.readouterr().out
+
+def test_save_and_input(tmp_path, pool, capsys):
+  path, ads = pool
+  ads = write_json(tmp_path/'jobs.json', ads)
+  snapshot = str(tmp_path/'jobs.snapshot')
+  for opts in ([], ['-summary'], ['-sitesummary'], ['-held'], ['-user','alice','-running']):
+    direct = probe(capsys, ['-input',ads,'-save',snapshot]+opts)
+    jobs = condor.data.job_cache.to_dict()
+    assert probe(capsys, ['-input',snapshot]+opts) == direct
+    assert condor.data.job_cache.to_dict() == jobs
+    assert len(jobs) > 0
+
+def test_diff(tmp_path, pool, capsys):
+  path, ads = pool
+  ads = [dict(x) for x in ads]
+  snapshot = str(tmp_path/'jobs.snapshot')
+  probe(capsys, ['-input',write_json(tmp_path/'before.json',ads),'-save',snapshot])
+  running = [x for x in ads if x['JobStatus'] == 2]
+  idle = [x for x in ads if x['JobStatus'] == 1]
+  running[0]['JobStatus'] = 5
+  running[1]['JobStatus'] = 5
+  idle[0]['JobStatus'] = 2
+  idle[0]['MATCH_GLIDEIN_Site'] = 'MIT'
+  ads.remove(running[2])
+  cluster = max([x['ClusterId'] for x in ads])+1
+  new = dict(idle[1], ClusterId=cluster, ProcId=0, JobStatus=1)
+  new['UserLog'] = new['UserLog'].replace('job.%d.%d.'%(idle[1]['ClusterId'],idle[1]['ProcId']), 'job.%d.0.'%cluster)
+  ads.append(new)
+  output = probe(capsys, ['-input',write_json(tmp_path/'after.json',ads),'-diff',snapshot])
+  args = condor.probe.cli.parse_args(['-input','after.json']+options)
+  condor.probe.check(args)
+  since, counts, sites, clusters = condor.data.transitions(args, snapshot)
+  assert counts == {'R->H':2, 'I->R':1, 'R->gone':1, 'new->I':1}
+  assert sites['MIT']['I->R'] == 1
+  assert clusters == {cluster:1}
+  assert 'State Transitions since' in output
+  assert 'R->H' in output and 'New Clusters' in output
+  # and nothing changed since itself:
+  probe(capsys, ['-input',write_json(tmp_path/'after.json',ads),'-save',snapshot])
+  assert condor.data.transitions(args, snapshot)[1] == {}
@@ -0,0 +1,151 @@
+import random
+
+import condor.store
+
+def new_table():
+  return condor.store.JobTable([
+    condor.store.IntColumn('ClusterId'),
+    condor.store.IntColumn('JobStatus','b'),
+    condor.store.BoolColumn('ExitBySignal'),
+    condor.store.FloatColumn('RemoteUserCpu'),
+    condor.store.FloatColumn('wallhr','%.2f'),
+    condor.store.NumberColumn('ceff','%.2f'),
+    condor.store.CodeColumn('site'),
+    condor.store.Column('Args'),
+    condor.store.VectorColumn('benchmark', ['a','b']),
+  ], derived = {
+    'condorid': lambda job: '%d.%d'%(job['ClusterId'],job['ProcId']) if 'ProcId' in job else None,
+  }, indexes = ['ClusterId','JobStatus','site'])
+
+def check_indexes(table):
+  '''The postings of each indexed column must hold exactly the rows
+  holding each value'''
+  for column in table.columns.values():
+    if column.postings is not None:
+      expected = {}
+      for row,x in enumerate(column.data):
+        expected.setdefault(x, set()).add(row)
+      assert {k:v for k,v in column.postings.items() if len(v) > 0} == expected
+  assert len(table.keys) == len(table.order) == len(table.index)
+  assert all(table.index[k] == i for i,k in enumerate(table.keys))
+  for column in table.columns.values():
+    assert len(column) == len(table.keys)
+
+def classad(rng, cluster):
+  return {'ClusterId':cluster, 'JobStatus':rng.choice([1,2,4,5]),
+    'ExitBySignal':rng.choice([True,False,None]), 'RemoteUserCpu':rng.choice([None,rng.random()]),
+    'wallhr':rng.random()*10, 'ceff':rng.choice([0, 0.25, None]),
+    'site':rng.choice(['MIT','UConn',None]), 'Args':'%d'%rng.randint(0,9),
+    'benchmark':rng.choice([None, [1.0, 2.0]])}
+
+def fill(rng, table, n=300):
+  expected = {}
+  for i in range(n):
+    key = '%d.%d'%(rng.randint(1,5), rng.randint(0,40))
+    rank = rng.randint(0,2)
+    x = classad(rng, int(key.split('.')[0]))
+    if key in expected and expected[key][0] > rank:
+      assert table.add(key, x, rank) is None
+      continue
+    assert table.add(key, x, rank) is not None
+    expected[key] = (rank, x)
+  return expected
+
+def test_add_replace_by_rank():
+  rng = random.Random(1)
+  table = new_table()
+  expected = fill(rng, table)
+  check_indexes(table)
+  assert sorted(table.keys) == sorted(expected)
+  for key,(rank,x) in expected.items():
+    job = table[key]
+    assert table.rank(key) == rank
+    assert job['ClusterId'] == x['ClusterId']
+    assert job.get('site') == x['site']
+    assert job.get('ExitBySignal') == x['ExitBySignal']
+    assert job.get('wallhr') == '%.2f'%x['wallhr']
+    assert job.get('RemoteUserCpu') == x['RemoteUserCpu']
+    assert job.get('ceff') == (None if x['ceff'] is None else x['ceff'] if x['ceff'] == 0 else '%.2f'%x['ceff'])
+    assert job.get('benchmark') == (None if x['benchmark'] is None else {'a':1.0, 'b':2.0, 'list':[1.0,2.0], 'str':'1.0/2.0'})
+
+def test_none_values():
+  table = new_table()
+  job = table.add('1.0', {'ClusterId':1})
+  for key in ('JobStatus','ExitBySignal','RemoteUserCpu','wallhr','ceff','site','Args','benchmark'):
+    assert job.get(key) is None
+    assert key not in job
+  assert table.take('RemoteUserCpu', [0]) == [None]
+  assert set(job.to_dict().keys()) == {'ClusterId'}
+
+def test_number_column_keeps_integers():
+  table = new_table()
+  table.add('1.0', {'ClusterId':1, 'ceff':0})
+  table.add('1.1', {'ClusterId':1, 'ceff':0.0})
+  table.add('1.2', {'ClusterId':1, 'ceff':0.5})
+  assert [table[k].get('ceff') for k in ('1.0','1.1','1.2')] == [0, '0.00', '0.50']
+  assert table.take('ceff', [0,1,2]) == [0, 0.0, 0.5]
+  table['1.1']['ceff'] = 0
+  table['1.0']['ceff'] = 0.25
+  assert [table[k].get('ceff') for k in ('1.0','1.1')] == ['0.25', 0]
+
+def test_pop_keeps_indexes():
+  rng = random.Random(2)
+  table = new_table()
+  fill(rng, table, 100)
+  for i in range(30):
+    key = 'new.%d'%i
+    table.add(key, classad(rng, rng.randint(1,5)))
+    if rng.random() < 0.5:
+      table.pop()
+      assert key not in table
+    check_indexes(table)
+
+def test_sort_orders_by_rank_then_arrival():
+  rng = random.Random(3)
+  table = new_table()
+  expected = fill(rng, table)
+  before = {k:table[k].to_dict() for k in table.keys}
+  table.sort()
+  check_indexes(table)
+  ranks = [table.rank(k) for k in table.keys]
+  assert ranks == sorted(ranks)
+  assert list(table.order) == sorted(table.order)
+  assert {k:table[k].to_dict() for k in table.keys} == before
+
+def brute(table, predicates, residual=None):
+  return [row for row in range(len(table)) if all(p(table.columns[k].get(row)) for k,p in predicates)
+    and (residual is None or residual(table.view(row)))]
+
+def test_select_matches_scan():
+  rng = random.Random(4)
+  table = new_table()
+  fill(rng, table)
+  for i in range(10):
+    table.add('new.%d'%i, classad(rng, 3))
+    table.pop()
+  table.sort()
+  queries = [
+    [],
+    [('JobStatus', lambda x: x == 2)],
+    [('JobStatus', lambda x: x != 2)],
+    [('site', lambda x: x == 'MIT'), ('ClusterId', lambda x: x in (1,2))],
+    [('site', lambda x: x is None)],
+    [('ClusterId', lambda x: x != 3), ('JobStatus', lambda x: x in (1,5))],
+    [('Args', lambda x: x == '3')],
+    [('RemoteUserCpu', lambda x: x is not None and x > 0.5)],
+  ]
+  for predicates in queries:
+    assert list(table.select(predicates)) == brute(table, predicates)
+    residual = lambda job: job.get('ExitBySignal') is True
+    assert list(table.select(predicates, residual)) == brute(table, predicates, residual)
+
+def test_clear_keeps_indexes():
+  rng = random.Random(5)
+  table = new_table()
+  fill(rng, table)
+  table.clear()
+  check_indexes(table)
+  assert len(table) == 0
+  fill(rng, table, 50)
+  check_indexes(table)
+  assert list(table.select([('JobStatus', lambda x: x == 4)])) == brute(table, [('JobStatus', lambda x: x == 4)])
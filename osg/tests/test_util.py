@@ -0,0 +1,73 @@
+import io
+import gzip
+import json
+
+import pytest
+
+import condor.util
+
+documents = [
+  [],
+  {},
+  [1, 'two', None, True, 3.5],
+  [{'ClusterId':1, 'ProcId':0, 'Args':'a, b] {c}', 'Cmd':'"quoted" \\u00e9'}, {'ClusterId':1, 'ProcId':1}],
+  {'1.0':{'ClusterId':1, 'x':[1,[2,[3]]]}, '1.1':{'ClusterId':1, 'y':{'z':'}'}}},
+]
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 65536])
+@pytest.mark.parametrize('document', documents)
+def test_read_json_matches_json_loads(document, chunk_size):
+  for text in (json.dumps(document), json.dumps(document, indent=2)):
+    expected = json.loads(text)
+    if isinstance(expected, dict):
+      expected = list(expected.values())
+    assert list(condor.util.read_json(io.StringIO(text), chunk_size)) == expected
+
+def test_read_json_condor_output():
+  # condor_history -json separates ClassAds with a comma on its own line:
+  text = '[\n{"a":1}\n,\n{"a":2}\n]\n'
+  assert list(condor.util.read_json(io.StringIO(text), 3)) == [{'a':1}, {'a':2}]
+
+def test_read_json_empty_input():
+  assert list(condor.util.read_json(io.StringIO(''))) == []
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 65536])
+@pytest.mark.parametrize('text', ['[{"a":1},{"a":', '[{"a":1},', '[{"a":1}', '{"x":{"a":1},"y"'])
+def test_read_json_truncated(text, chunk_size):
+  with pytest.raises(ValueError):
+    list(condor.util.read_json(io.StringIO(text), chunk_size))
+
+def test_read_json_not_a_container():
+  with pytest.raises(ValueError):
+    list(condor.util.read_json(io.StringIO('42')))
+
+def write(path, text):
+  if path.endswith('.gz'):
+    with gzip.open(path, 'wt') as f:
+      f.write(text)
+  else:
+    with open(path, 'w') as f:
+      f.write(text)
+
+@pytest.mark.parametrize('suffix', ['.out', '.out.gz'])
+@pytest.mark.parametrize('newline', ['\n', ''])
+def test_readlines_reverse(tmp_path, suffix, newline):
+  lines = ['line %d %s'%(i, 'x'*(i%13)) for i in range(500)]
+  path = str(tmp_path/('job'+suffix))
+  write(path, '\n'.join(lines)+newline)
+  expected = list(reversed(lines))
+  for block_size in (1, 10, 4096, 65536):
+    assert list(condor.util.readlines_reverse(path, 0, block_size)) == expected
+    assert list(condor.util.readlines_reverse(path, -1, block_size)) == expected
+    assert list(condor.util.readlines_reverse(path, 20, block_size)) == expected[0:20]
+
+@pytest.mark.parametrize('suffix', ['.out', '.out.gz'])
+def test_readlines_reverse_short_files(tmp_path, suffix):
+  path = str(tmp_path/('job'+suffix))
+  for text,expected in (('', []), ('\n', ['']), ('only', ['only']), ('a\n\nb\n', ['b','','a'])):
+    write(path, text)
+    assert list(condor.util.readlines_reverse(path, 0, 2)) == expected
+
+def test_readlines_reverse_missing_file(tmp_path):
+  assert list(condor.util.readlines_reverse(str(tmp_path/'missing.out'), 10)) == []
+  assert list(condor.util.readlines_reverse(None, 10)) == []
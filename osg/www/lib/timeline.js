@@ -0,0 +1,55 @@
+// Load the rollups of the timeline written by condor-probe.py -timeline,
+// i.e. timeline/{daily,hourly,raw}.json, each with series of [ts, min,
+// mean, max, n] points for the global counts and for each site, where the
+// finer ones only cover recent times (see condor/timeline.py):
+
+const rollupRetention = {'raw':3*86400e3, 'hourly':42*86400e3, 'daily':Infinity}
+const rollupCache = {}
+
+function loadRollup(name) {
+    if (rollupCache[name] == undefined) {
+        rollupCache[name] = fetch('timeline/'+name+'.json').then(response => response.json())
+    }
+    return rollupCache[name]
+}
+
+// choose the finest rollup covering a time range in milliseconds:
+function chooseRollup(min, max) {
+    const now = Date.now()
+    for (const name of ['raw','hourly']) {
+        if (max - min <= rollupRetention[name] && min >= now - rollupRetention[name]) {
+            return name
+        }
+    }
+    return 'daily'
+}
+
+// convert rollup points into Highcharts' [x, low, y, high] points, with y the mean:
+function rollupPoints(points) {
+    return points.map(x => [x[0]*1000, x[1], x[2], x[3]])
+}
+
+const rollupKeys = ['x','low','y','high']
+const rollupTooltip = '<span style="color:{point.color}">●</span> {series.name}: <b>{point.y:.1f}</b> ({point.low}-{point.high})<br/>'
+
+// load the finest rollup suited to a range, and pass it to the callback if
+// it's not the one currently shown:
+var currentRollup = 'daily'
+function refineRollup(min, max, callback) {
+    const name = chooseRollup(min, max)
+    if (name != currentRollup) {
+        currentRollup = name
+        loadRollup(name).then(rollup => { if (name == currentRollup) callback(rollup) })
+    }
+}
+
+// replace the data of each chart's series by name, e.g. after refineRollup:
+function updateCharts(charts, data) {
+    for (var i=0; i<charts.length; i++) {
+        charts[i].series.forEach(s => {
+            if (s.name.startsWith('Navigator')) return
+            s.setData(data[i][s.name] || [], false)
+        })
+        charts[i].redraw()
+    }
+}